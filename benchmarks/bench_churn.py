@@ -0,0 +1,59 @@
+"""
+    Re-indexing after a share of the corpus changed: Pipeline.upsert_many of
+    the modified rows against rebuilding the whole index
+
+    python benchmarks/bench_churn.py --rows 50000 --churn 0.1
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+import numpy as np
+from localitylens import Pipeline
+from bench_insert import random_rows
+
+
+def modified(rows, share, seed=0):
+    rng = random.Random(seed)
+    changed = rng.sample(rows, int(len(rows) * share))
+    return [dict(row, content=row['content'] + ' edited', size_bytes=row['size_bytes'] + 1) for row in changed]
+
+
+def rebuild(db_name, rows, embeddings):
+    start = time.perf_counter()
+    pipeline = Pipeline(db_name, 'bench', embeddings.shape[1])
+    pipeline.insert_many(rows, embeddings, 'content', 'link', batch_size=5000)
+    return time.perf_counter() - start, pipeline
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--churn', type=float, default=0.1)
+    args = parser.parse_args()
+
+    rows = list(random_rows(args.rows))
+    embeddings = np.random.rand(args.rows, args.dim).astype(np.float32)
+    changed = modified(rows, args.churn)
+    changed_embeddings = np.random.rand(len(changed), args.dim).astype(np.float32)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        elapsed, pipeline = rebuild(os.path.join(tmpdir, 'full.db'), rows, embeddings)
+        print(f'full build          {args.rows:7d} rows {elapsed:8.2f}s')
+
+        start = time.perf_counter()
+        pipeline.upsert_many(changed, changed_embeddings, 'content', 'link', batch_size=5000)
+        elapsed = time.perf_counter() - start
+        print(f'upsert_many         {len(changed):7d} rows {elapsed:8.2f}s')
+
+        start = time.perf_counter()
+        removed = pipeline.delete_many([row['link'] for row in changed])
+        elapsed = time.perf_counter() - start
+        print(f'delete_many         {removed:7d} rows {elapsed:8.2f}s')
+
+        # what re-indexing the changed corpus cost without upsert
+        by_link = {row['link']: row for row in changed}
+        elapsed, _ = rebuild(os.path.join(tmpdir, 'rebuild.db'), [by_link.get(row['link'], row) for row in rows],
+                             embeddings)
+        print(f'rebuild             {args.rows:7d} rows {elapsed:8.2f}s')
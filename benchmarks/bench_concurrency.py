@@ -0,0 +1,67 @@
+"""
+    Pipeline.search queries/second from several threads, with and without an
+    insert_many job writing at the same time
+
+    python benchmarks/bench_concurrency.py --rows 50000
+"""
+import os
+import time
+import argparse
+import tempfile
+import threading
+import numpy as np
+from bench_insert import random_rows
+from bench_search import build_pipeline, query_terms
+
+
+def bench_qps(pipeline, queries, dim, n_threads, duration, top_k):
+    stop = threading.Event()
+    counts = [0] * n_threads
+
+    def worker(idx):
+        rng = np.random.default_rng(idx)
+        while not stop.is_set():
+            embedding = rng.random(dim, dtype=np.float32)
+            pipeline.search(queries[counts[idx] % len(queries)], embedding, top_k=top_k)
+            counts[idx] += 1
+
+    threads = [threading.Thread(target=worker, args=(idx, )) for idx in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / duration
+
+
+def writer(pipeline, dim, stop):
+    offset = 0
+    while not stop.is_set():
+        rows = [dict(row, link=f'{row["link"]}.{offset}') for row in random_rows(200, seed=offset)]
+        pipeline.insert_many(rows, np.random.rand(len(rows), dim).astype(np.float32), 'content', 'link')
+        offset += 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--top-k', type=int, default=30)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pipeline = build_pipeline(os.path.join(tmpdir, 'concurrency.db'), args.rows, args.dim, read_pool_size=8)
+        queries = query_terms(pipeline, 100)
+        for ingest in (False, True):
+            stop = threading.Event()
+            if ingest:
+                thread = threading.Thread(target=writer, args=(pipeline, args.dim, stop))
+                thread.start()
+            for n_threads in (1, 2, 4, 8):
+                qps = bench_qps(pipeline, queries, args.dim, n_threads, args.duration, args.top_k)
+                print(f'threads={n_threads:<2d} ingest={str(ingest):<5s} {qps:10.1f} queries/s')
+            stop.set()
+            if ingest:
+                thread.join()
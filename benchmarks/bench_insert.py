@@ -0,0 +1,56 @@
+"""
+    Rows/second of the per-row Pipeline.insert against Pipeline.insert_many
+
+    python benchmarks/bench_insert.py --rows 20000
+"""
+import os
+import time
+import random
+import string
+import argparse
+import tempfile
+import numpy as np
+from localitylens import Pipeline
+
+
+def random_rows(n, seed=0):
+    rng = random.Random(seed)
+    words = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for _ in range(5000)]
+    for idx in range(n):
+        yield {
+            'content': ' '.join(rng.choices(words, k=80)),
+            'link': f'/home/user/file_{idx}.txt',
+            'size_bytes': rng.randint(0, 1 << 20),
+            'mime_type': rng.choice(['text/plain', 'application/pdf', 'text/x-python']),
+        }
+
+
+def bench_insert(db_name, rows, embeddings):
+    pipeline = Pipeline(db_name, 'bench', embeddings.shape[1])
+    start = time.perf_counter()
+    for row, embedding in zip(rows, embeddings):
+        pipeline.insert(row, embedding, 'content', 'link')
+    return time.perf_counter() - start
+
+
+def bench_insert_many(db_name, rows, embeddings, batch_size):
+    pipeline = Pipeline(db_name, 'bench', embeddings.shape[1])
+    start = time.perf_counter()
+    pipeline.insert_many(rows, embeddings, 'content', 'link', batch_size=batch_size)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    rows = list(random_rows(args.rows))
+    embeddings = np.random.rand(args.rows, args.dim).astype(np.float32)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        elapsed = bench_insert(os.path.join(tmpdir, 'insert.db'), rows, embeddings)
+        print(f'insert      : {args.rows / elapsed:10.1f} rows/s ({elapsed:.2f}s)')
+        elapsed = bench_insert_many(os.path.join(tmpdir, 'insert_many.db'), rows, embeddings, args.batch_size)
+        print(f'insert_many : {args.rows / elapsed:10.1f} rows/s ({elapsed:.2f}s, batch_size={args.batch_size})')
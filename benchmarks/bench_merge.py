@@ -0,0 +1,46 @@
+"""
+    TokenTextSplitter on a document without spaces or newlines, where every
+    character becomes a split and _merge handles one entry per character
+
+    python benchmarks/bench_merge.py --mb 1
+"""
+import time
+import random
+import argparse
+import tiktoken
+from localitylens.node_parser.text.token import TokenTextSplitter
+
+
+def chinese_text(n_bytes, seed=0):
+    # common CJK ideographs (3 bytes in UTF-8) with a comma or full stop
+    # every dozen or so characters, and no whitespace at all
+    rng = random.Random(seed)
+    chars = [chr(code) for code in range(0x4e00, 0x4e00 + 3000)]
+    parts = []
+    for _ in range(n_bytes // 3):
+        parts.append(rng.choice(chars))
+        if rng.random() < 0.08:
+            parts.append(rng.choice('，。'))
+    return ''.join(parts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mb', type=float, default=1)
+    parser.add_argument('--encoding', default='cl100k_base')
+    parser.add_argument('--chunk-size', type=int, default=1024)
+    parser.add_argument('--chunk-overlap', type=int, default=200)
+    args = parser.parse_args()
+
+    text = chinese_text(int(args.mb * 1e6))
+    encoding = tiktoken.get_encoding(args.encoding)
+    print(f'{len(text)} characters, {len(text.encode("utf-8")) / 1e6:.1f}MB')
+    splitter = TokenTextSplitter(args.chunk_size, args.chunk_overlap, tokenizer=encoding.encode)
+
+    start = time.perf_counter()
+    splits = splitter._split(text, args.chunk_size, splitter._token_counter(text))
+    split_time = time.perf_counter() - start
+    start = time.perf_counter()
+    chunks = splitter._merge(splits, args.chunk_size)
+    merge_time = time.perf_counter() - start
+    print(f'split {split_time:6.2f}s  merge {merge_time:6.2f}s  {len(splits)} splits -> {len(chunks)} chunks')
@@ -0,0 +1,81 @@
+"""
+    Database size and filtered search latency of key/value metadata against
+    typed metadata_fields columns, and the cost of migrating between them
+
+    python benchmarks/bench_metadata.py --rows 200000
+"""
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+from localitylens import Pipeline
+from bench_insert import random_rows
+from bench_search import query_terms, bench_search
+
+FIELDS = {'size_bytes': int, 'mime_type': str}
+FILTERS = (
+    {'mime_type': 'application/pdf'},
+    {'size_bytes': {'lt': 10000}},
+    {'size_bytes': {'gte': 1 << 19}, 'mime_type': 'text/plain'},
+)
+
+
+def build(db_name, rows, dim, **kwargs):
+    pipeline = Pipeline(db_name, 'bench', dim, **kwargs)
+    pipeline.insert_many(rows, np.random.rand(len(rows), dim).astype(np.float32), 'content', 'link',
+                         batch_size=50000)
+    return pipeline
+
+
+def metadata_size(pipeline):
+    # bytes of the metadata tables and their indexes
+    names = [pipeline.meta_table, pipeline.fields_table]
+    return pipeline.conn.execute(f'''
+        SELECT SUM(pgsize) FROM dbstat
+         WHERE name IN ({', '.join('?' * len(names))})
+            OR name IN (SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name IN ({', '.join('?' * len(names))}))
+        ''', names * 2).fetchone()[0] or 0
+
+
+def bench_filter_select(pipeline, filters, repeats=20):
+    # the row_id selection on its own, without the fts5/vss side of search
+    sql, params = pipeline._row_filter(filters)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        count = pipeline.conn.execute(f'SELECT COUNT(*) FROM ({sql})', params).fetchone()[0]
+    return (time.perf_counter() - start) / repeats * 1000, count
+
+
+def report(label, pipeline, queries, dim):
+    print(f'{label}: metadata {metadata_size(pipeline) / 1e6:.1f}MB, file {os.path.getsize(pipeline.db_name) / 1e6:.1f}MB')
+    for filters in FILTERS:
+        select_ms, count = bench_filter_select(pipeline, filters)
+        mean, p95 = bench_search(pipeline, queries, 30, dim, filters)
+        print(f'  {str(filters):<58s} {count:7d} rows  select {select_ms:7.2f}ms  '
+              f'search mean {mean:7.2f}ms p95 {p95:7.2f}ms')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--dim', type=int, default=8)
+    parser.add_argument('--queries', type=int, default=20)
+    args = parser.parse_args()
+
+    rows = list(random_rows(args.rows))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        kv = build(os.path.join(tmpdir, 'kv.db'), rows, args.dim, result_cache_size=0)
+        typed = build(os.path.join(tmpdir, 'typed.db'), rows, args.dim, result_cache_size=0, metadata_fields=FIELDS)
+        queries = query_terms(kv, args.queries)
+        report('key/value', kv, queries, args.dim)
+        report('metadata_fields', typed, queries, args.dim)
+        kv.close()
+
+        # an existing key/value database opened with metadata_fields
+        start = time.perf_counter()
+        migrated = Pipeline(kv.db_name, 'bench', args.dim, result_cache_size=0, metadata_fields=FIELDS)
+        elapsed = time.perf_counter() - start
+        migrated.conn.execute('VACUUM')
+        print(f'migration of {args.rows} rows {elapsed:.2f}s')
+        report('migrated + VACUUM', migrated, queries, args.dim)
@@ -0,0 +1,35 @@
+"""
+    Scaling of get_nodes_from_documents(num_workers=...) over a directory of
+    source files
+
+    python benchmarks/bench_parse_workers.py --root /usr/lib/python3.11 --workers 1 2 4 8
+"""
+import os
+import time
+import argparse
+import tiktoken
+from localitylens.node_parser.text.token import TokenTextSplitter
+from bench_token_cache import load_documents
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root', default=os.path.dirname(os.__file__))
+    parser.add_argument('--max-files', type=int, default=2000)
+    parser.add_argument('--encoding', default='cl100k_base')
+    parser.add_argument('--chunk-size', type=int, default=1024)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    documents = load_documents(args.root, args.max_files)
+    print(f'{len(documents)} documents, {sum(len(doc.text) for doc in documents) / 1e6:.1f}M characters, '
+          f'{os.cpu_count()} CPUs')
+    splitter = TokenTextSplitter(args.chunk_size, 20, tokenizer=tiktoken.get_encoding(args.encoding).encode)
+    baseline = None
+    for num_workers in args.workers:
+        start = time.perf_counter()
+        nodes = splitter.get_nodes_from_documents(documents, num_workers=num_workers)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f'num_workers={num_workers:<3d} {elapsed:7.2f}s  {len(nodes) / elapsed:8.0f} nodes/s  '
+              f'speedup {baseline / elapsed:5.2f}x')
@@ -0,0 +1,65 @@
+"""
+    Per-keystroke latency of Pipeline.search_prefix, with and without FTS5
+    prefix indexes and the result cache
+
+    python benchmarks/bench_prefix.py --rows 1000000
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+import numpy as np
+from localitylens import Pipeline
+from bench_insert import random_rows
+
+
+def build(db_name, prefix_name, rows, dim, **kwargs):
+    pipeline = Pipeline(db_name, prefix_name, dim, **kwargs)
+    pipeline.insert_many(rows, np.zeros((len(rows), dim), dtype=np.float32), 'content', 'link', batch_size=50000)
+    return pipeline
+
+
+def keystrokes(pipeline, n_queries, seed=0):
+    # type two words of a stored row one character at a time
+    rng = random.Random(seed)
+    contents = pipeline.conn.execute(f'SELECT content FROM {pipeline.main_table} ORDER BY random() LIMIT ?',
+                                     (n_queries, )).fetchall()
+    for content, in contents:
+        words = content.split()
+        start = rng.randrange(len(words) - 1)
+        text = ' '.join(words[start:start + 2])
+        yield [text[:end] for end in range(1, len(text) + 1)]
+
+
+def bench(label, pipeline, typed):
+    latencies = []
+    for queries in typed:
+        for query in queries:
+            start = time.perf_counter()
+            pipeline.search_prefix(query, top_k=10)
+            latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+    print(f'{label:<32s} mean {latencies.mean():8.2f}ms  p95 {np.percentile(latencies, 95):8.2f}ms'
+          f'  max {latencies.max():8.2f}ms')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--dim', type=int, default=8)
+    parser.add_argument('--queries', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_name = os.path.join(tmpdir, 'prefix.db')
+        rows = list(random_rows(args.rows))
+        build(db_name, 'plain', rows, args.dim)
+        build(db_name, 'indexed', rows, args.dim, fts_prefix=(2, 3, 4))
+        for prefix_name, fts_prefix in (('plain', None), ('indexed', (2, 3, 4))):
+            uncached = Pipeline(db_name, prefix_name, args.dim, fts_prefix=fts_prefix, result_cache_size=0)
+            cached = Pipeline(db_name, prefix_name, args.dim, fts_prefix=fts_prefix, result_cache_size=4096)
+            typed = list(keystrokes(uncached, args.queries))
+            bench(f'{prefix_name} no cache', uncached, typed)
+            bench(f'{prefix_name} cache (first time)', cached, typed)
+            bench(f'{prefix_name} cache (typed again)', cached, typed)
@@ -0,0 +1,69 @@
+"""
+    Pipeline.search latency as top_k grows
+
+    python benchmarks/bench_search.py --rows 50000
+"""
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+from localitylens import Pipeline
+from bench_insert import random_rows
+
+
+def build_pipeline(db_name, n_rows, dim, **kwargs):
+    pipeline = Pipeline(db_name, 'bench', dim, **kwargs)
+    embeddings = np.random.rand(n_rows, dim).astype(np.float32)
+    pipeline.insert_many(random_rows(n_rows), embeddings, 'content', 'link')
+    return pipeline
+
+
+def query_terms(pipeline, n_queries):
+    # sample frequent words so every query has at least top_k fts5 hits
+    rows = pipeline.conn.execute(f'SELECT content FROM {pipeline.main_table} LIMIT ?', (n_queries, )).fetchall()
+    return [content.split()[0] for content, in rows]
+
+
+def bench_search(pipeline, queries, top_k, dim, filters=None):
+    latencies = []
+    for query in queries:
+        embedding = np.random.rand(dim).astype(np.float32)
+        start = time.perf_counter()
+        pipeline.search(query, embedding, top_k=top_k, filters=filters)
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+    return latencies.mean(), np.percentile(latencies, 95)
+
+
+def bench_repeated(pipeline, queries, top_k, dim, repeats=5):
+    # type-ahead style, every query is issued again right after
+    embeddings = [np.random.rand(dim).astype(np.float32) for _ in queries]
+    latencies = []
+    for query, embedding in zip(queries, embeddings):
+        for _ in range(repeats):
+            start = time.perf_counter()
+            pipeline.search(query, embedding, top_k=top_k)
+            latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+    return latencies.mean(), np.percentile(latencies, 95)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pipeline = build_pipeline(os.path.join(tmpdir, 'search.db'), args.rows, args.dim)
+        queries = query_terms(pipeline, args.queries)
+        for top_k in (10, 100, 1000):
+            mean, p95 = bench_search(pipeline, queries, top_k, args.dim)
+            print(f'top_k={top_k:<5d} mean {mean:8.2f}ms  p95 {p95:8.2f}ms')
+        for filters in ({'mime_type': 'application/pdf'}, {'size_bytes': {'lt': 10000}}):
+            mean, p95 = bench_search(pipeline, queries, 30, args.dim, filters)
+            print(f'filters={filters} mean {mean:8.2f}ms  p95 {p95:8.2f}ms')
+        mean, p95 = bench_repeated(pipeline, queries, 30, args.dim)
+        print(f'repeated     mean {mean:8.2f}ms  p95 {p95:8.2f}ms  {pipeline.result_cache_stats()}')
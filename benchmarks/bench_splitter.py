@@ -0,0 +1,72 @@
+"""
+    TokenTextSplitter on a large document: one tiktoken pass with token
+    offsets against tokenizing every split
+
+    python benchmarks/bench_splitter.py --mb 10
+    python benchmarks/bench_splitter.py --file big.txt
+"""
+import time
+import random
+import string
+import argparse
+import tiktoken
+from localitylens.node_parser.text.token import TokenTextSplitter
+
+
+def synthetic_text(n_chars, seed=0):
+    # paragraphs of random words, with the odd blank line
+    rng = random.Random(seed)
+    words = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10))) for _ in range(20000)]
+    parts, size = [], 0
+    while size < n_chars:
+        paragraph = ' '.join(rng.choices(words, k=rng.randint(20, 200))) + rng.choice(['.\n', '.\n\n', '. '])
+        parts.append(paragraph)
+        size += len(paragraph)
+    return ''.join(parts)[:n_chars]
+
+
+class CountingTokenizer():
+    """Wraps encode, hiding it from the offsets path and counting calls."""
+
+    def __init__(self, encode):
+        self.encode = encode
+        self.calls = 0
+
+    def __call__(self, text):
+        self.calls += 1
+        return self.encode(text)
+
+
+def bench(label, splitter, text, tokenizer=None):
+    start = time.perf_counter()
+    chunks = splitter.split_text(text)
+    elapsed = time.perf_counter() - start
+    calls = f'{tokenizer.calls:8d} tokenizer calls' if tokenizer is not None else ''
+    print(f'{label:<22s} {elapsed:8.2f}s  {len(chunks):6d} chunks  {calls}')
+    return chunks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mb', type=float, default=10)
+    parser.add_argument('--file', default=None)
+    parser.add_argument('--encoding', default='cl100k_base')
+    parser.add_argument('--chunk-size', type=int, default=1024)
+    parser.add_argument('--chunk-overlap', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, encoding='utf-8') as f:
+            text = f.read()
+    else:
+        text = synthetic_text(int(args.mb * 1e6))
+    encoding = tiktoken.get_encoding(args.encoding)
+    print(f'{len(text) / 1e6:.1f}M characters')
+
+    offsets = bench('token offsets', TokenTextSplitter(args.chunk_size, args.chunk_overlap,
+                                                        tokenizer=encoding.encode), text)
+    tokenizer = CountingTokenizer(encoding.encode)
+    per_split = bench('tokenize every split', TokenTextSplitter(args.chunk_size, args.chunk_overlap,
+                                                               tokenizer=tokenizer), text, tokenizer)
+    same = sum(a == b for a, b in zip(offsets, per_split))
+    print(f'{same}/{max(len(offsets), len(per_split))} chunks identical')
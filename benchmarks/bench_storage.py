@@ -0,0 +1,54 @@
+"""
+    Initial load of the file index: insert_or_update_file per file against
+    upsert_files, then search_files latency over the loaded paths
+
+    python benchmarks/bench_storage.py --files 1000000
+"""
+import os
+import time
+import argparse
+import tempfile
+from localitylens.dir_walker.storage import FileStore
+
+
+def synthetic_records(n_files, files_per_dir=100, with_metadata=True):
+    for idx in range(n_files):
+        directory = f'/data/project_{idx // 100000}/dir_{idx // files_per_dir}'
+        metadata = {'group': 'text', 'mime_type': 'text/plain'} if with_metadata else {}
+        yield (directory, f'file_{idx % files_per_dir}.txt', 1, idx % 4096, '2024-01-01', metadata,
+               1700000000000000000 + idx, idx)
+
+
+def bench(label, fn, count):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<28s} {count:8d} files {elapsed:8.2f}s {count / elapsed:10.1f} files/s')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=1000000)
+    parser.add_argument('--per-file', type=int, default=20000, help='files loaded through insert_or_update_file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = FileStore(os.path.join(tmpdir, 'dir.sqlite'))
+        store.create_tables()
+
+        def per_file():
+            for record in synthetic_records(args.per_file):
+                store.insert_or_update_file(*record[:6], mtime_ns=record[6], inode=record[7])
+
+        bench('insert_or_update_file', per_file, args.per_file)
+        store.conn.execute('DELETE FROM file_metadata')
+        store.conn.execute('DELETE FROM files')
+        store.conn.commit()
+        bench('upsert_files', lambda: store.upsert_files(synthetic_records(args.files)), args.files)
+        bench('upsert_files (reload)', lambda: store.upsert_files(synthetic_records(args.files)), args.files)
+
+        for query in ('dir_1234 file_42', 'project_3 file_9.txt', 'file_42', '_9 .t', 'no_such_file'):
+            start = time.perf_counter()
+            hits = store.search_files(query, limit=50)
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f'search_files {query!r:<24s} {len(hits):4d} hits {elapsed:8.2f}ms')
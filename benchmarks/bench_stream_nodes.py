@@ -0,0 +1,77 @@
+"""
+    Peak RSS of parsing a generated corpus into a Pipeline: the list returned
+    by get_nodes_from_documents against streaming iter_nodes_from_documents
+    into insert_many. Each mode runs in its own process.
+
+    python benchmarks/bench_stream_nodes.py --mb 20000
+"""
+import os
+import sys
+import time
+import random
+import string
+import resource
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+import tiktoken
+from localitylens import Pipeline
+from localitylens.node_parser.text.schema import Document
+from localitylens.node_parser.text.token import TokenTextSplitter
+
+DIM = 8
+
+
+def documents(total_chars, doc_chars, seed=0):
+    # generated on the fly, the corpus never exists in memory as a whole
+    rng = random.Random(seed)
+    words = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10))) for _ in range(20000)]
+    for idx in range(total_chars // doc_chars):
+        text = ' '.join(rng.choices(words, k=doc_chars // 6))
+        yield Document(text=text, metadata={'file_name': f'doc_{idx}.txt'})
+
+
+def rows(nodes):
+    for node in nodes:
+        yield {'content': node.text, 'link': node.node_id, 'file_name': node.metadata['file_name']}
+
+
+def run(mode, args):
+    splitter = TokenTextSplitter(args.chunk_size, 20, tokenizer=tiktoken.get_encoding(args.encoding).encode)
+    docs = documents(int(args.mb * 1e6), args.doc_kb * 1000)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pipeline = Pipeline(os.path.join(tmpdir, 'stream.db'), 'nodes', DIM, result_cache_size=0)
+        embed = lambda texts: np.zeros((len(texts), DIM), dtype=np.float32)
+        start = time.perf_counter()
+        if mode == 'list':
+            nodes = splitter.get_nodes_from_documents(list(docs))
+        else:
+            nodes = splitter.iter_nodes_from_documents(docs)
+        count = len(pipeline.insert_many(rows(nodes), None, 'content', 'link', batch_embedding_fn=embed))
+        elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f'{mode:<8s} {count:8d} nodes {elapsed:8.2f}s  peak RSS {peak:8.1f}MB')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mb', type=float, default=1000)
+    parser.add_argument('--doc-kb', type=int, default=200)
+    parser.add_argument('--encoding', default='cl100k_base')
+    parser.add_argument('--chunk-size', type=int, default=1024)
+    parser.add_argument('--modes', nargs='+', default=['stream', 'list'])
+    parser.add_argument('--mode', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode is not None:
+        run(args.mode, args)
+    else:
+        print(f'{args.mb:.0f}MB corpus in {args.doc_kb}KB documents')
+        for mode in args.modes:
+            # the list mode is expected to run out of memory on a corpus
+            # larger than RAM, its process dying is a result too
+            result = subprocess.run([sys.executable, __file__, *sys.argv[1:], '--mode', mode])
+            if result.returncode != 0:
+                print(f'{mode:<8s} exited with {result.returncode}')
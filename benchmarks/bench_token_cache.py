@@ -0,0 +1,62 @@
+"""
+    Hit rate of the shared token length cache and the tokenizer time it saves
+    when splitting a directory of source files into nodes
+
+    python benchmarks/bench_token_cache.py --root /usr/lib/python3.11 --max-files 2000
+"""
+import os
+import time
+import argparse
+import tiktoken
+from localitylens.node_parser.text.schema import Document
+from localitylens.node_parser.text.token import TokenTextSplitter
+from localitylens.node_parser.utils import token_length_cache
+
+
+def load_documents(root, max_files):
+    documents = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in sorted(filenames):
+            if not filename.endswith(('.py', '.txt', '.md', '.rst')):
+                continue
+            path = os.path.join(dirpath, filename)
+            try:
+                with open(path, encoding='utf-8') as f:
+                    text = f.read()
+            except (UnicodeDecodeError, OSError):
+                continue
+            if text.strip():
+                documents.append(Document(text=text, metadata={
+                    'file_path': path,
+                    'file_name': filename,
+                }))
+            if len(documents) == max_files:
+                return documents
+    return documents
+
+
+def bench(label, splitter, documents):
+    token_length_cache.clear()
+    start = time.perf_counter()
+    nodes = splitter.get_nodes_from_documents(documents)
+    elapsed = time.perf_counter() - start
+    stats = token_length_cache.stats()
+    print(f'{label:<22s} {elapsed:7.2f}s  {len(nodes):7d} nodes  hit rate {stats["hit_rate"]:6.1%}  '
+          f'tokenizer {stats["tokenizer_seconds"]:6.2f}s  saved {stats["saved_seconds"]:6.2f}s')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root', default=os.path.dirname(os.__file__))
+    parser.add_argument('--max-files', type=int, default=2000)
+    parser.add_argument('--encoding', default='cl100k_base')
+    parser.add_argument('--chunk-size', type=int, default=1024)
+    args = parser.parse_args()
+
+    documents = load_documents(args.root, args.max_files)
+    print(f'{len(documents)} documents, {sum(len(doc.text) for doc in documents) / 1e6:.1f}M characters')
+    encoding = tiktoken.get_encoding(args.encoding)
+    bench('tiktoken (offsets)', TokenTextSplitter(args.chunk_size, 20, tokenizer=encoding.encode), documents)
+    # any tokenizer without offsets, e.g. a transformers tokenize function
+    bench('per-split tokenizer', TokenTextSplitter(args.chunk_size, 20, tokenizer=lambda text: encoding.encode(text)),
+          documents)
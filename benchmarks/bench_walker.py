@@ -0,0 +1,57 @@
+"""
+    find_files_and_dirs against the threaded iter_files_and_dirs on a synthetic tree
+
+    python benchmarks/bench_walker.py --files 500000
+"""
+import os
+import time
+import argparse
+import tempfile
+from localitylens.dir_walker.index import find_files_and_dirs, iter_files_and_dirs
+
+IGNORE_PATTERNS = ['*/.env', '*/.venv', '*/node_modules/*', '*/.git/*', '*/env', '*/.npm', '*/.vscode', '*/.config', '*/.mozilla', '*/snap']
+
+
+def build_tree(root, n_files, files_per_dir=100, dirs_per_dir=20):
+    # breadth first so the tree is wide and a few levels deep
+    n_dirs = max(1, n_files // files_per_dir)
+    directories = [root]
+    idx = 0
+    while len(directories) < n_dirs:
+        parent = directories[idx]
+        for d in range(dirs_per_dir):
+            path = os.path.join(parent, f'dir_{d}')
+            os.mkdir(path)
+            directories.append(path)
+        idx += 1
+    created = 0
+    for directory in directories:
+        for f in range(files_per_dir):
+            if created == n_files:
+                return
+            with open(os.path.join(directory, f'file_{f}.txt'), 'w') as fout:
+                fout.write('x' * (f % 7))
+            created += 1
+
+
+def bench(label, fn):
+    start = time.perf_counter()
+    count = sum(1 for _ in fn())
+    elapsed = time.perf_counter() - start
+    print(f'{label:<28s} {count:8d} entries {elapsed:8.2f}s {count / elapsed:10.1f} entries/s')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=500000)
+    parser.add_argument('--root', default=None, help='walk an existing tree instead of a synthetic one')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        root = args.root
+        if root is None:
+            root = tmpdir
+            build_tree(root, args.files)
+        bench('find_files_and_dirs', lambda: find_files_and_dirs(root, IGNORE_PATTERNS))
+        for num_workers in (1, 4, 8, 16):
+            bench(f'iter_files_and_dirs x{num_workers}', lambda: iter_files_and_dirs(root, IGNORE_PATTERNS, num_workers))
@@ -1 +1,2 @@
-from .hybrid_search.sqlite_pipeline import Pipeline
\ No newline at end of file
+from .hybrid_search.sqlite_pipeline import Pipeline
+from .hybrid_search.async_pipeline import AsyncPipeline
\ No newline at end of file
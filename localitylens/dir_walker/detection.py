@@ -0,0 +1,72 @@
+"""
+    Batched content type detection with Magika
+
+    identify_paths is called with hundreds of paths at a time instead of one,
+    spread over a pool of worker processes that each load the model once.
+"""
+import os
+import itertools
+from collections import deque
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_DETECTION_BATCH_SIZE = 256
+
+_model = None
+
+
+def _load_model():
+    global _model
+    if _model is None:
+        from magika import Magika
+        _model = Magika()
+    return _model
+
+
+def output_metadata(output):
+    metadata = {}
+    if hasattr(output, 'group'):
+        metadata['group'] = output.group
+    if hasattr(output, 'mime_type'):
+        metadata['mime_type'] = output.mime_type
+    return metadata
+
+
+def identify_batch(paths):
+    results = _load_model().identify_paths([Path(path) for path in paths])
+    return [output_metadata(result.output) for result in results]
+
+
+def _batches(paths, batch_size):
+    it = iter(paths)
+    while True:
+        batch = list(itertools.islice(it, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def detect_content_types(paths, batch_size=DEFAULT_DETECTION_BATCH_SIZE, num_workers=None):
+    """Yield (path, {'group', 'mime_type'}) for every path, in input order.
+
+    num_workers defaults to os.cpu_count(), with 0 detection runs in this
+    process. Only 2 batches per worker are in flight, so paths can be a
+    generator over a huge tree.
+    """
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    batches = _batches(paths, batch_size)
+    if num_workers == 0:
+        for batch in batches:
+            yield from zip(batch, identify_batch(batch))
+        return
+    with ProcessPoolExecutor(num_workers, initializer=_load_model) as pool:
+        in_flight = deque()
+        for batch in batches:
+            in_flight.append((batch, pool.submit(identify_batch, batch)))
+            if len(in_flight) >= 2 * num_workers:
+                batch, future = in_flight.popleft()
+                yield from zip(batch, future.result())
+        while in_flight:
+            batch, future = in_flight.popleft()
+            yield from zip(batch, future.result())
@@ -0,0 +1,190 @@
+"""
+    Ignore pattern matching for the directory walkers
+
+    Global patterns keep fnmatch semantics (matched against the full path)
+    but are compiled once: the common '*/name' and '*/name/*' shapes become
+    set lookups on path components, everything else is folded into a single
+    regex. Optionally .gitignore / .ignore files are honored per directory.
+"""
+import os
+import re
+import fnmatch
+
+GLOB_CHARS = set('*?[')
+IGNORE_FILES = ('.gitignore', '.ignore')
+
+
+class IgnoreRule():
+    """One line of a .gitignore file, relative to the directory it lives in."""
+
+    def __init__(self, regex, negated, dir_only):
+        self.regex = regex
+        self.negated = negated
+        self.dir_only = dir_only
+
+
+def _translate_glob(pattern):
+    """Translate a gitignore glob, where '*' never crosses '/', into a regex."""
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            out.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i):
+            out.append('.*')
+            i += 2
+        elif c == '*':
+            out.append('[^/]*')
+            i += 1
+        elif c == '?':
+            out.append('[^/]')
+            i += 1
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end < 0:
+                out.append(re.escape(c))
+                i += 1
+                continue
+            body = pattern[i + 1:end]
+            if body[0] == '!':
+                body = '^' + body[1:]
+            out.append('[' + body.replace('\\', '\\\\') + ']')
+            i = end + 1
+        elif c == '\\' and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return ''.join(out)
+
+
+def parse_ignore_file(text):
+    rules = []
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        if not line.endswith('\\ '):
+            line = line.rstrip()
+        negated = line.startswith('!')
+        if negated:
+            line = line[1:]
+        elif line.startswith('\\!') or line.startswith('\\#'):
+            line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            continue
+        # a slash anywhere but the end anchors the pattern to this directory,
+        # otherwise it matches the name at any depth
+        if '/' in line:
+            regex = _translate_glob(line.lstrip('/'))
+        else:
+            regex = '(?:.*/)?' + _translate_glob(line)
+        rules.append(IgnoreRule(re.compile(regex + r'\Z', re.S), negated, dir_only))
+    return rules
+
+
+class IgnoreMatcher():
+    """Compiled form of a list of fnmatch ignore patterns.
+
+    With ignore_files (e.g. IGNORE_FILES) the rules of those files are
+    evaluated per directory, later and deeper rules win and '!' re-includes.
+    Parsed files are cached by (path, mtime_ns).
+    """
+
+    def __init__(self, patterns, ignore_files=()):
+        self.patterns = list(patterns)
+        self.ignore_files = tuple(ignore_files)
+        self.names = set()
+        self.dir_names = set()
+        rest = []
+        for pattern in self.patterns:
+            name = pattern[2:]
+            if pattern.startswith('*/') and name.endswith('/*') and not GLOB_CHARS & set(name[:-2]) and '/' not in name[:-2]:
+                self.dir_names.add(name[:-2])
+            elif pattern.startswith('*/') and not GLOB_CHARS & set(name) and '/' not in name:
+                self.names.add(name)
+            else:
+                rest.append(fnmatch.translate(pattern))
+        self.regex = re.compile('|'.join(rest)) if rest else None
+        self._cache = {}
+
+    def match(self, path):
+        """Same result as any(fnmatch.fnmatch(path, p) for p in patterns)."""
+        slash = path.rfind('/')
+        if slash >= 0 and path[slash + 1:] in self.names:
+            return True
+        if self.dir_names:
+            # '*/name/*' matches when name is any component after the first
+            # one that is followed by a slash
+            components = path.split('/')
+            if any(component in self.dir_names for component in components[1:-1]):
+                return True
+        return self.regex is not None and self.regex.match(path) is not None
+
+    def _load(self, path):
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            self._cache.pop(path, None)
+            return []
+        cached = self._cache.get(path)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+        try:
+            with open(path, encoding='utf-8', errors='replace') as fin:
+                rules = parse_ignore_file(fin.read())
+        except OSError:
+            rules = []
+        self._cache[path] = (mtime_ns, rules)
+        return rules
+
+    def directory_rules(self, directory, inherited=()):
+        """Rules in effect for the entries of directory.
+
+        inherited is the value returned for its parent, each element pairs a
+        base directory with the rules read there.
+        """
+        if not self.ignore_files:
+            return inherited
+        rules = []
+        for filename in self.ignore_files:
+            rules += self._load(os.path.join(directory, filename))
+        if not rules:
+            return inherited
+        return tuple(inherited) + ((directory, rules),)
+
+    def rules_below(self, root, directory):
+        """directory_rules for a directory at any depth below root."""
+        rules = self.directory_rules(root)
+        relative = os.path.relpath(directory, root)
+        if relative == '.' or relative.startswith('..'):
+            return rules
+        current = root
+        for part in relative.split(os.sep):
+            current = os.path.join(current, part)
+            rules = self.directory_rules(current, rules)
+        return rules
+
+    def ignored(self, path, is_dir, rules=()):
+        if self.match(path):
+            return True
+        ignored = False
+        for base, base_rules in rules:
+            relative = path[len(base):].lstrip('/')
+            for rule in base_rules:
+                if rule.dir_only and not is_dir:
+                    continue
+                if rule.regex.match(relative):
+                    ignored = not rule.negated
+        return ignored
+
+
+def compile_ignore(ignore_patterns):
+    """Accept either a list of patterns or an already built IgnoreMatcher."""
+    if isinstance(ignore_patterns, IgnoreMatcher):
+        return ignore_patterns
+    return IgnoreMatcher(ignore_patterns)
@@ -1,21 +1,21 @@
 import os
 import pwd
-import fnmatch
-from pathlib import Path
+import queue
+import threading
+from functools import lru_cache
 from datetime import datetime, date
-from magika import Magika
+from localitylens.dir_walker.ignore import IGNORE_FILES, IgnoreMatcher, compile_ignore
 
-def get_file_metadata(file_path):
-    # Get basic file stats
+@lru_cache(maxsize=None)
+def get_owner(uid):
     try:
-        stats = os.stat(file_path)
-    except FileNotFoundError:
-        return 'unknown', date.min, date.min, -1
-    # Fetch the owner of the file
-    try:
-        owner = pwd.getpwuid(stats.st_uid).pw_name
+        return pwd.getpwuid(uid).pw_name
     except KeyError:
-        owner = 'Unknown'  # In case the user ID doesn't match any user
+        return 'Unknown'  # In case the user ID doesn't match any user
+
+def stat_metadata(stats):
+    # Fetch the owner of the file
+    owner = get_owner(stats.st_uid)
 
     # Convert creation and modification times to readable format
     creation_date = datetime.fromtimestamp(stats.st_ctime).strftime('%Y-%m-%d %H:%M:%S')
@@ -25,29 +25,234 @@ def get_file_metadata(file_path):
 
     return owner, creation_date, modified_date, size
 
+def get_file_metadata(file_path):
+    # Get basic file stats
+    try:
+        stats = os.stat(file_path)
+    except FileNotFoundError:
+        return 'unknown', date.min, date.min, -1
+    return stat_metadata(stats)
+
 def find_files_and_dirs(directory, ignore_patterns):
+    matcher = compile_ignore(ignore_patterns)
     matches = []
+    inherited_rules = {}
     for root, dirnames, filenames in os.walk(directory, topdown=True):
-        # Filter out ignored directories
-        dirnames[:] = [d for d in dirnames if not any(fnmatch.fnmatch(os.path.join(root, d), pattern) for pattern in ignore_patterns)]
+        rules = matcher.directory_rules(root, inherited_rules.pop(root, ()))
+        # Filter out ignored directories, pruned ones are neither walked nor listed
+        dirnames[:] = [d for d in dirnames if not matcher.ignored(os.path.join(root, d), True, rules)]
         
         # Add directories not ignored to matches with a tag
         for dirname in dirnames:
             dir_path = os.path.join(root, dirname)
-            if not any(fnmatch.fnmatch(dir_path, pattern) for pattern in ignore_patterns):
-                owner, creation_date, modified_date, size = get_file_metadata(dir_path)
-                matches.append((dir_path, 0, owner, creation_date, modified_date, size))
+            inherited_rules[dir_path] = rules
+            owner, creation_date, modified_date, size = get_file_metadata(dir_path)
+            matches.append((dir_path, 0, owner, creation_date, modified_date, size))
         # Add files not ignored to matches with a tag
         for filename in filenames:
             file_path = os.path.join(root, filename)
-            if not any(fnmatch.fnmatch(file_path, pattern) for pattern in ignore_patterns):
+            if not matcher.ignored(file_path, False, rules):
                 owner, creation_date, modified_date, size = get_file_metadata(file_path)
                 matches.append((file_path, 1, owner, creation_date, modified_date, size))
     return matches
 
+def _scan_directory(root, matcher, inherited_rules=()):
+    records, subdirs = [], []
+    try:
+        entries = list(os.scandir(root))
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        return records, subdirs
+    rules = matcher.directory_rules(root, inherited_rules)
+    for entry in entries:
+        path = entry.path
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if matcher.ignored(path, is_dir, rules):
+            continue
+        # like os.walk, symlinked directories are reported but not followed
+        try:
+            is_symlink = entry.is_symlink()
+        except OSError:
+            is_symlink = True
+        if is_dir and not is_symlink:
+            subdirs.append((path, rules))
+        try:
+            metadata = stat_metadata(entry.stat())
+        except OSError:
+            # dangling or looping symlinks, permission errors, races with deletes
+            metadata = ('unknown', date.min, date.min, -1)
+        records.append((path, 0 if is_dir else 1) + metadata)
+    return records, subdirs
+
+def iter_files_and_dirs(directory, ignore_patterns, num_workers=8, max_pending=1024):
+    """Streaming, multi-threaded version of find_files_and_dirs.
+
+    Yields the same (path, type, owner, ctime, mtime, size) tuples, but in no
+    particular order. Every worker scans one directory at a time and pushes
+    its subdirectories back onto a shared queue, so idle threads pick up
+    whatever part of the tree is left. At most max_pending directories worth
+    of records are buffered ahead of the consumer. An exception raised while
+    scanning stops the walk and is re-raised in the consumer.
+    """
+    matcher = compile_ignore(ignore_patterns)
+    directories = queue.Queue()
+    results = queue.Queue(maxsize=max_pending)
+    stop = threading.Event()
+    lock = threading.Lock()
+    outstanding = [1]
+    errors = []
+
+    def put_result(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def worker():
+        while True:
+            item = directories.get()
+            if item is None:
+                return
+            try:
+                if stop.is_set() or errors:
+                    records, subdirs = [], []
+                else:
+                    records, subdirs = _scan_directory(item[0], matcher, item[1])
+                with lock:
+                    outstanding[0] += len(subdirs)
+                for subdir in subdirs:
+                    directories.put(subdir)
+                if records:
+                    put_result(records)
+            except BaseException as e:
+                # the remaining directories are skipped and the consumer
+                # re-raises the error once the sentinel arrives
+                errors.append(e)
+            finally:
+                with lock:
+                    outstanding[0] -= 1
+                    done = outstanding[0] == 0
+                if done:
+                    for _ in range(num_workers):
+                        directories.put(None)
+                    put_result(None)
+
+    directories.put((directory, ()))
+    for _ in range(num_workers):
+        threading.Thread(target=worker, daemon=True).start()
+    try:
+        while True:
+            records = results.get()
+            if records is None:
+                if errors:
+                    raise errors[0]
+                return
+            yield from records
+    finally:
+        # let the workers wind down if the consumer stopped early
+        stop.set()
+
+def scan_changes(directory, ignore_patterns, snapshot):
+    """Compare the tree below directory against a stored snapshot.
+
+    snapshot maps path -> (mtime_ns, size, inode), see
+    storage.get_file_snapshots. Only entries whose stat differs are turned
+    into full records, so an unchanged tree costs one scandir stat per entry.
+
+    Returns (added, modified, deleted): added and modified hold the tuples of
+    find_files_and_dirs extended with mtime_ns and inode, deleted holds the
+    paths in the snapshot that are gone or now ignored.
+    """
+    matcher = compile_ignore(ignore_patterns)
+    added, modified = [], []
+    seen = set()
+    stack = [(directory, ())]
+    while stack:
+        root, inherited_rules = stack.pop()
+        try:
+            entries = list(os.scandir(root))
+        except OSError:
+            continue
+        rules = matcher.directory_rules(root, inherited_rules)
+        for entry in entries:
+            path = entry.path
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if matcher.ignored(path, is_dir, rules):
+                continue
+            try:
+                stats = entry.stat()
+            except OSError:
+                # a dangling or looping symlink is recorded with the stat of
+                # the link itself, an entry that can't be stat'ed at all
+                # (gone meanwhile, no permission) ends up in deleted
+                try:
+                    stats = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+            try:
+                is_symlink = entry.is_symlink()
+            except OSError:
+                is_symlink = True
+            if is_dir and not is_symlink:
+                stack.append((path, rules))
+            seen.add(path)
+            current = (stats.st_mtime_ns, stats.st_size, stats.st_ino)
+            previous = snapshot.get(path)
+            if previous == current:
+                continue
+            owner, creation_date, modified_date, size = stat_metadata(stats)
+            record = (path, 0 if is_dir else 1, owner, creation_date, modified_date, size,
+                      stats.st_mtime_ns, stats.st_ino)
+            if previous is None:
+                added.append(record)
+            else:
+                modified.append(record)
+    deleted = [path for path in snapshot if path not in seen]
+    return added, modified, deleted
+
+def update_index(directory, ignore_patterns, metadata_fn=None, detect_content=False, num_workers=None, store=None):
+    """Write only the added/modified/deleted entries below directory to storage.
+
+    Like every walker here, ignore_patterns is a list of fnmatch patterns or
+    an ignore.IgnoreMatcher (e.g. one that also honors .gitignore files).
+
+    metadata_fn(path) -> dict supplies the file_metadata of changed files.
+    With detect_content the group/mime_type of changed files is detected with
+    Magika in batches over num_workers processes; files whose size and mtime
+    are unchanged since their mime_type was stored are not looked at again.
+
+    store is a storage.FileStore, by default the one over dir.sqlite.
+    """
+    if store is None:
+        from localitylens.dir_walker import storage
+        store = storage.default_store()
+    snapshot = store.get_file_snapshots(directory, 'mime_type' if detect_content else None)
+    added, modified, deleted = scan_changes(directory, ignore_patterns, snapshot)
+    detected = {}
+    if detect_content:
+        from localitylens.dir_walker.detection import detect_content_types
+        paths = [record[0] for record in added + modified if record[1]]
+        detected = dict(detect_content_types(paths, num_workers=num_workers))
+    records = []
+    for path, item_type, owner, creation_date, modified_date, size, mtime_ns, inode in added + modified:
+        metadata = metadata_fn(path) if metadata_fn is not None and item_type else {}
+        metadata.update(detected.get(path, {}))
+        records.append((os.path.dirname(path), os.path.basename(path), item_type, size,
+                        creation_date, metadata, mtime_ns, inode))
+    store.upsert_files(records)
+    store.delete_files(deleted)
+    return added, modified, deleted
+
 
 if __name__ == "__main__":
-    model = Magika()
+    from localitylens.dir_walker.detection import detect_content_types
     # Specify the root directory to search from, e.g., '.', for the current directory
     root_directory = '/home/theblackcat102'
 
@@ -56,7 +261,12 @@ if __name__ == "__main__":
     ignore_patterns = ['*/.env', '*/.venv', '*/node_modules/*', '*/.git/*', '*/env', '*/.npm', '*/.vscode', '*/.config', '*/.mozilla', '*/snap']
 
     # Find files and directories, excluding the ones that match the ignore_patterns
-    found_items = find_files_and_dirs(root_directory, ignore_patterns)
+    # or any .gitignore/.ignore file on the way
+    found_items = find_files_and_dirs(root_directory, IgnoreMatcher(ignore_patterns, IGNORE_FILES))
+
+    # Detect content types of all files at once, batched over a process pool
+    files = [params[0] for params in found_items if params[1] and params[0][-5:] != '.lock']
+    detected = dict(detect_content_types(files))
 
     # Print the paths of the items found along with their type
     for params in found_items:
@@ -66,14 +276,10 @@ if __name__ == "__main__":
             filename = os.path.basename(path)
             if filename[-5:] == '.lock':
                 continue
-            result = model.identify_paths([ Path(path) ])[0].output
             metadata = {}
             if size >= 0:
                 metadata['size_bytes'] = size
-            if hasattr(result, 'group'):
-                metadata['group'] = result.group
-            if hasattr(result, 'mime_type'):
-                metadata['mime_type'] = result.mime_type
+            metadata.update(detected[path])
             print(filename, metadata)
         else:
             print(f"{path} ({item_type}) - Owner: {owner}, Created: {creation_date}, Modified: {modified_date} {size}")
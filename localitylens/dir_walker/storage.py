@@ -9,86 +9,549 @@
         FOREIGN KEY (directory_id) REFERENCES directories(directory_id)
 
 """
+import os
 import sqlite3
+import threading
 from datetime import datetime
+from collections import OrderedDict
+from localitylens.hybrid_search.connection_pool import read_only_uri
+from localitylens.hybrid_search.metadata_fields import field_columns, create_fields_table, migrate_fields, split_fields, quote
 
-# Connect to SQLite database (or create it if it doesn't exist)
-conn = sqlite3.connect('dir.sqlite')
-cursor = conn.cursor()
+DEFAULT_DB_PATH = 'dir.sqlite'
+# files per transaction in upsert_files
+UPSERT_BATCH_SIZE = 50000
+# keeps the IN (...) lists below SQLite's bound parameter limit
+SQLITE_MAX_VARIABLES = 900
 
-# Function to create tables
-def create_tables():
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS directories (
-        directory_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        directory_path TEXT NOT NULL UNIQUE
-    );''')
+# matches of search_files that get ordered
+SEARCH_FILES_CANDIDATES = 1000
 
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS files (
-        file_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        filename TEXT NOT NULL,
-        file_type INTEGER NOT NULL,
-        byte_size INTEGER NOT NULL,
-        creation_date DATE NOT NULL,
-        directory_id INTEGER,
-        FOREIGN KEY (directory_id) REFERENCES directories(directory_id)
-    );''')
-
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS file_metadata (
-        metadata_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        file_id INTEGER NOT NULL,
-        meta_key TEXT NOT NULL,
-        meta_value TEXT,
-        FOREIGN KEY (file_id) REFERENCES files(file_id)
-    );''')
-
-    # Create indexes to improve search performance
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_filename ON files(filename);')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_filetype ON files(file_type);')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_creationdate ON files(creation_date);')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_directory ON files(directory_id);')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_metadata_key_value ON file_metadata(meta_key, meta_value);')
-
-    conn.commit()
-
-# Function to insert or update file information
-def insert_or_update_file(directory_path, filename, file_type, file_size, creation_date, metadata_dict):
-    # Check if the directory exists, insert if not
-    cursor.execute('SELECT directory_id FROM directories WHERE directory_path = ?', (directory_path,))
-    directory = cursor.fetchone()
-    if directory is None:
-        cursor.execute('INSERT INTO directories (directory_path) VALUES (?)', (directory_path,))
-        directory_id = cursor.lastrowid
-    else:
-        directory_id = directory[0]
-
-    # Check if the file exists
-    cursor.execute('SELECT file_id FROM files WHERE filename = ? AND directory_id = ?', (filename, directory_id))
-    file = cursor.fetchone()
-    if file is None:
-        # Insert new file record
-        cursor.execute('INSERT INTO files (filename, file_type, byte_size, creation_date, directory_id) VALUES (?, ?, ?, ?, ?)',
-                       (filename, file_type, file_size, creation_date, directory_id))
-        file_id = cursor.lastrowid
-    else:
-        file_id = file[0]
-        # Update file record (if you have specific fields to update, modify this query accordingly)
-        cursor.execute('UPDATE files SET file_type = ?, creation_date = ?, byte_size = ? WHERE file_id = ?',
-                       (file_type, creation_date, file_size, file_id))
-
-    # Insert or update metadata
-    for key, value in metadata_dict.items():
-        cursor.execute('SELECT metadata_id FROM file_metadata WHERE file_id = ? AND meta_key = ?', (file_id, key))
-        metadata = cursor.fetchone()
-        if metadata is None:
-            cursor.execute('INSERT INTO file_metadata (file_id, meta_key, meta_value) VALUES (?, ?, ?)',
-                           (file_id, key, value))
+# metadata derived from a file's content (detection.output_metadata), it
+# goes stale once the file changes
+CONTENT_METADATA_KEYS = ('group', 'mime_type')
+
+# full path of a files row, the directory '/' must not give '//name'
+PATH_SQL = "rtrim(directories.directory_path, '/') || '/' || {}.filename"
+
+# applied to the writer and every reader connection
+CONNECTION_PRAGMAS = (
+    'PRAGMA cache_size = -65536',  # 64MB page cache
+    'PRAGMA mmap_size = 268435456',  # 256MB
+    'PRAGMA temp_store = MEMORY',
+)
+
+
+class LRUCache():
+    """Small bounded mapping that forgets the least recently used key."""
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+
+    def get(self, key):
+        value = self.data.get(key)
+        if value is not None:
+            self.data.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def clear(self):
+        self.data.clear()
+
+
+class FileStore():
+    """File index in one SQLite database.
+
+    A single writer connection, guarded by a lock so any thread may write,
+    runs in WAL mode with synchronous=NORMAL. Reads go through read-only
+    connections opened once per thread, so queries from other threads do not
+    wait for an ingest in progress. In-memory databases cannot be shared
+    between connections and read through the writer instead.
+
+    metadata_fields declares metadata keys kept as typed, indexed columns of
+    file_fields instead of TEXT rows of file_metadata, e.g.
+    {'size_bytes': int, 'mime_type': str}.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, metadata_fields=None):
+        self.db_path = db_path = os.fspath(db_path)
+        self.fields = field_columns(metadata_fields, reserved=('file_id', ))
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.cursor = self.conn.cursor()
+        self.in_memory = db_path == ':memory:' or db_path == ''
+        if not self.in_memory:
+            self.conn.execute('PRAGMA journal_mode = WAL')
+            self.conn.execute('PRAGMA synchronous = NORMAL')
+        for pragma in CONNECTION_PRAGMAS:
+            self.conn.execute(pragma)
+        self.lock = threading.RLock()
+        self._local = threading.local()
+        self._readers = []
+        # directory_path -> directory_id, directories rows are never deleted
+        # so entries do not go stale
+        self.directory_ids = LRUCache()
+
+    def reader(self):
+        """Read-only connection of the calling thread."""
+        if self.in_memory:
+            return self.conn
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(read_only_uri(self.db_path), uri=True, check_same_thread=False)
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self.lock:
+                self._readers.append(conn)
+        return conn
+
+    def _read(self, sql, params=()):
+        if self.in_memory:
+            with self.lock:
+                return self.conn.execute(sql, params).fetchall()
+        return self.reader().execute(sql, params).fetchall()
+
+    def close(self):
+        with self.lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers = []
+            self.conn.close()
+
+    def create_tables(self):
+        with self.lock:
+            self._create_tables()
+
+    def _create_tables(self):
+        cursor = self.cursor
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS directories (
+            directory_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            directory_path TEXT NOT NULL UNIQUE
+        );''')
+
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS files (
+            file_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT NOT NULL,
+            file_type INTEGER NOT NULL,
+            byte_size INTEGER NOT NULL,
+            creation_date DATE NOT NULL,
+            directory_id INTEGER,
+            mtime_ns INTEGER,
+            inode INTEGER,
+            FOREIGN KEY (directory_id) REFERENCES directories(directory_id)
+        );''')
+        # databases created before incremental indexing lack the snapshot columns
+        columns = {row[1] for row in cursor.execute('PRAGMA table_info(files)')}
+        for column in ('mtime_ns', 'inode'):
+            if column not in columns:
+                cursor.execute(f'ALTER TABLE files ADD COLUMN {column} INTEGER')
+
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS file_metadata (
+            metadata_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_id INTEGER NOT NULL,
+            meta_key TEXT NOT NULL,
+            meta_value TEXT,
+            FOREIGN KEY (file_id) REFERENCES files(file_id)
+        );''')
+
+        # Create indexes to improve search performance
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_filename ON files(filename);')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_filetype ON files(file_type);')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_creationdate ON files(creation_date);')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_directory ON files(directory_id);')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_metadata_key_value ON file_metadata(meta_key, meta_value);')
+
+        # upsert_files relies on these as ON CONFLICT targets, older databases may
+        # hold duplicates written by insert_or_update_file races so keep the newest
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_files_directory_filename'")
+        if cursor.fetchone() is None:
+            cursor.execute('''
+            DELETE FROM files WHERE file_id NOT IN (SELECT MAX(file_id) FROM files GROUP BY directory_id, filename)''')
+            cursor.execute('DELETE FROM file_metadata WHERE file_id NOT IN (SELECT file_id FROM files)')
+            cursor.execute('CREATE UNIQUE INDEX idx_files_directory_filename ON files(directory_id, filename);')
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_metadata_file_key'")
+        if cursor.fetchone() is None:
+            cursor.execute('''
+            DELETE FROM file_metadata WHERE metadata_id NOT IN (
+                SELECT MAX(metadata_id) FROM file_metadata GROUP BY file_id, meta_key)''')
+            cursor.execute('CREATE UNIQUE INDEX idx_metadata_file_key ON file_metadata(file_id, meta_key);')
+
+        # trigram index over full paths for substring search, rowid is file_id
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'file_paths'")
+        populate = cursor.fetchone() is None
+        cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS file_paths USING fts5(
+            path,
+            tokenize='trigram'
+        );''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS insert_file_paths_trg AFTER INSERT ON files
+        BEGIN
+            INSERT INTO file_paths (rowid, path)
+            SELECT new.file_id, {PATH_SQL.format('new')} FROM directories WHERE directory_id = new.directory_id;
+        END;''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS update_file_paths_trg AFTER UPDATE OF filename, directory_id ON files
+        BEGIN
+            DELETE FROM file_paths WHERE rowid = old.file_id;
+            INSERT INTO file_paths (rowid, path)
+            SELECT new.file_id, {PATH_SQL.format('new')} FROM directories WHERE directory_id = new.directory_id;
+        END;''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS delete_file_paths_trg AFTER DELETE ON files
+        BEGIN
+            DELETE FROM file_paths WHERE rowid = old.file_id;
+        END;''')
+        if populate:
+            self._rebuild_filename_index()
+
+        if self.fields:
+            # values stored under a newly declared key move to its column
+            added = create_fields_table(cursor, 'file_fields', 'file_id', self.fields)
+            migrate_fields(cursor, 'file_fields', 'file_id', 'file_metadata', added)
+
+        # a write that changes a file's size or mtime without detecting it
+        # again (update_index without detect_content, the watcher) drops its
+        # content metadata, so get_file_snapshots(root, 'mime_type') reports
+        # the file for detection. Writes that did detect store the new values
+        # right after the files row. Rebuilt on open as metadata_fields may
+        # have changed
+        typed = [key for key in CONTENT_METADATA_KEYS if key in self.fields]
+        clear_fields = ''
+        if typed:
+            clear_fields = f'''
+            UPDATE file_fields SET {', '.join(f'{quote(key)} = NULL' for key in typed)} WHERE file_id = new.file_id;'''
+        cursor.execute('DROP TRIGGER IF EXISTS content_changed_trg')
+        cursor.execute(f'''
+        CREATE TRIGGER content_changed_trg AFTER UPDATE OF byte_size, mtime_ns ON files
+        WHEN old.byte_size IS NOT new.byte_size OR old.mtime_ns IS NOT new.mtime_ns
+        BEGIN
+            DELETE FROM file_metadata WHERE file_id = new.file_id
+               AND meta_key IN ({', '.join(f"'{key}'" for key in CONTENT_METADATA_KEYS)});{clear_fields}
+        END;''')
+
+        self.conn.commit()
+
+    def migrate_metadata(self):
+        """Move file_metadata rows of the declared metadata_fields into file_fields,
+        returns the number of rows moved."""
+        with self.lock:
+            try:
+                moved = migrate_fields(self.cursor, 'file_fields', 'file_id', 'file_metadata', self.fields)
+            except Exception:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+        return moved
+
+    def rebuild_filename_index(self):
+        """Recreate file_paths from files, e.g. after bulk edits with the triggers dropped."""
+        with self.lock:
+            self._rebuild_filename_index()
+            self.conn.commit()
+
+    def _rebuild_filename_index(self):
+        self.cursor.execute('DELETE FROM file_paths')
+        self.cursor.execute(f'''
+        INSERT INTO file_paths (rowid, path)
+        SELECT files.file_id, {PATH_SQL.format('files')}
+          FROM files JOIN directories ON files.directory_id = directories.directory_id''')
+        self.cursor.execute("INSERT INTO file_paths (file_paths) VALUES ('optimize')")
+
+    # insert or update file information
+    def insert_or_update_file(self, directory_path, filename, file_type, file_size, creation_date, metadata_dict,
+                              mtime_ns=None, inode=None):
+        with self.lock:
+            self._insert_or_update_file(directory_path, filename, file_type, file_size, creation_date,
+                                        metadata_dict, mtime_ns, inode)
+
+    def _insert_or_update_file(self, directory_path, filename, file_type, file_size, creation_date, metadata_dict,
+                               mtime_ns, inode):
+        cursor = self.cursor
+        # Check if the directory exists, insert if not
+        cursor.execute('SELECT directory_id FROM directories WHERE directory_path = ?', (directory_path,))
+        directory = cursor.fetchone()
+        if directory is None:
+            cursor.execute('INSERT INTO directories (directory_path) VALUES (?)', (directory_path,))
+            directory_id = cursor.lastrowid
+        else:
+            directory_id = directory[0]
+
+        # Check if the file exists
+        cursor.execute('SELECT file_id FROM files WHERE filename = ? AND directory_id = ?', (filename, directory_id))
+        file = cursor.fetchone()
+        if file is None:
+            # Insert new file record
+            cursor.execute('INSERT INTO files (filename, file_type, byte_size, creation_date, directory_id, mtime_ns, inode) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                           (filename, file_type, file_size, creation_date, directory_id, mtime_ns, inode))
+            file_id = cursor.lastrowid
         else:
-            cursor.execute('UPDATE file_metadata SET meta_value = ? WHERE file_id = ? AND meta_key = ?',
-                           (value, file_id, key))
+            file_id = file[0]
+            # Update file record (if you have specific fields to update, modify this query accordingly)
+            cursor.execute('UPDATE files SET file_type = ?, creation_date = ?, byte_size = ?, mtime_ns = ?, inode = ? WHERE file_id = ?',
+                           (file_type, creation_date, file_size, mtime_ns, inode, file_id))
+
+        # Insert or update metadata
+        typed, metadata_dict = split_fields(metadata_dict, self.fields)
+        if typed:
+            self._upsert_fields([(file_id, typed)])
+        for key, value in metadata_dict.items():
+            cursor.execute('SELECT metadata_id FROM file_metadata WHERE file_id = ? AND meta_key = ?', (file_id, key))
+            metadata = cursor.fetchone()
+            if metadata is None:
+                cursor.execute('INSERT INTO file_metadata (file_id, meta_key, meta_value) VALUES (?, ?, ?)',
+                               (file_id, key, value))
+            else:
+                cursor.execute('UPDATE file_metadata SET meta_value = ? WHERE file_id = ? AND meta_key = ?',
+                               (value, file_id, key))
+
+        self.conn.commit()
+
+    def _upsert_fields(self, rows):
+        # rows are (file_id, {field: value}), only the given fields are
+        # written so an upsert keeps the others, like it keeps other keys of
+        # file_metadata
+        groups = {}
+        for file_id, typed in rows:
+            groups.setdefault(tuple(typed), []).append((file_id, *typed.values()))
+        for names, values in groups.items():
+            self.cursor.executemany(f'''
+            INSERT INTO file_fields (file_id, {', '.join(map(quote, names))}) VALUES ({', '.join('?' * (len(names) + 1))})
+            ON CONFLICT(file_id) DO UPDATE SET {', '.join(f'{quote(name)} = excluded.{quote(name)}' for name in names)}
+            ''', values)
+
+    def _directory_ids(self, paths):
+        """Resolve (inserting when needed) the directory_id of every path."""
+        resolved = {}
+        missing = []
+        for path in paths:
+            directory_id = self.directory_ids.get(path)
+            if directory_id is None:
+                missing.append(path)
+            else:
+                resolved[path] = directory_id
+        if missing:
+            self.cursor.executemany('INSERT OR IGNORE INTO directories (directory_path) VALUES (?)',
+                                    [(path,) for path in missing])
+            for start in range(0, len(missing), SQLITE_MAX_VARIABLES):
+                batch = missing[start:start + SQLITE_MAX_VARIABLES]
+                self.cursor.execute(f'''
+                SELECT directory_path, directory_id FROM directories
+                 WHERE directory_path IN ({', '.join('?' * len(batch))})''', batch)
+                for path, directory_id in self.cursor.fetchall():
+                    self.directory_ids.put(path, directory_id)
+                    resolved[path] = directory_id
+        return resolved
+
+    def _upsert_batch(self, records):
+        cursor = self.cursor
+        directories = self._directory_ids(list({record[0] for record in records}))
+        rows = []
+        keyed = []
+        for directory_path, filename, file_type, file_size, creation_date, metadata_dict, *snapshot in records:
+            mtime_ns, inode = (snapshot + [None, None])[:2]
+            directory_id = directories[directory_path]
+            rows.append((filename, file_type, file_size, creation_date, directory_id, mtime_ns, inode))
+            if metadata_dict:
+                keyed.append((directory_id, filename, metadata_dict))
+        cursor.executemany('''
+        INSERT INTO files (filename, file_type, byte_size, creation_date, directory_id, mtime_ns, inode)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(directory_id, filename) DO UPDATE SET
+            file_type = excluded.file_type, byte_size = excluded.byte_size, creation_date = excluded.creation_date,
+            mtime_ns = excluded.mtime_ns, inode = excluded.inode
+        ''', rows)
+        if not keyed:
+            return
+        # the file ids of the whole batch in one join instead of a lookup per file
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS upsert_keys (directory_id INTEGER, filename TEXT, PRIMARY KEY (directory_id, filename)) WITHOUT ROWID')
+        cursor.execute('DELETE FROM upsert_keys')
+        cursor.executemany('INSERT OR IGNORE INTO upsert_keys (directory_id, filename) VALUES (?, ?)',
+                           [(directory_id, filename) for directory_id, filename, _ in keyed])
+        cursor.execute('''
+        SELECT upsert_keys.directory_id, upsert_keys.filename, files.file_id
+          FROM upsert_keys JOIN files ON files.directory_id = upsert_keys.directory_id AND files.filename = upsert_keys.filename
+        ''')
+        file_ids = {(directory_id, filename): file_id for directory_id, filename, file_id in cursor.fetchall()}
+        fields = []
+        pairs = []
+        for directory_id, filename, metadata_dict in keyed:
+            file_id = file_ids[(directory_id, filename)]
+            typed, metadata_dict = split_fields(metadata_dict, self.fields)
+            if typed:
+                fields.append((file_id, typed))
+            pairs += [(file_id, key, value) for key, value in metadata_dict.items()]
+        if fields:
+            self._upsert_fields(fields)
+        cursor.executemany('''
+        INSERT INTO file_metadata (file_id, meta_key, meta_value) VALUES (?, ?, ?)
+        ON CONFLICT(file_id, meta_key) DO UPDATE SET meta_value = excluded.meta_value
+        ''', pairs)
+
+    def _commit_batch(self, batch):
+        with self.lock:
+            try:
+                self._upsert_batch(batch)
+            except Exception:
+                self.conn.rollback()
+                # ids of directories inserted by the rolled back batch are gone
+                self.directory_ids.clear()
+                raise
+            self.conn.commit()
+        return len(batch)
+
+    # insert or update many files at once
+    # records are (directory_path, filename, file_type, file_size, creation_date,
+    # metadata_dict[, mtime_ns, inode]) tuples, the arguments of insert_or_update_file
+    def upsert_files(self, records, batch_size=UPSERT_BATCH_SIZE):
+        count = 0
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) == batch_size:
+                count += self._commit_batch(batch)
+                batch = []
+        if batch:
+            count += self._commit_batch(batch)
+        return count
+
+    # load the stored (mtime_ns, size, inode) of everything below a root
+    # with required_key, files lacking that metadata get a None mtime so they
+    # show up as modified in index.scan_changes
+    def get_file_snapshots(self, root_directory, required_key=None):
+        root_directory = root_directory.rstrip('/') or '/'
+        # '0' sorts right after '/', so the range covers every path below the root
+        prefix = root_directory.rstrip('/')
+        if required_key is None:
+            rows = self._read('''
+            SELECT directories.directory_path, files.filename, files.mtime_ns, files.byte_size, files.inode
+              FROM files JOIN directories ON files.directory_id = directories.directory_id
+             WHERE directories.directory_path = ?
+                OR (directories.directory_path >= ? AND directories.directory_path < ?)
+            ''', (root_directory, prefix + '/', prefix + '0'))
+        elif required_key in self.fields:
+            rows = self._read(f'''
+            SELECT directories.directory_path, files.filename,
+                   CASE WHEN files.file_type = 0 OR file_fields.{quote(required_key)} IS NOT NULL THEN files.mtime_ns END,
+                   files.byte_size, files.inode
+              FROM files JOIN directories ON files.directory_id = directories.directory_id
+              LEFT JOIN file_fields ON file_fields.file_id = files.file_id
+             WHERE directories.directory_path = ?
+                OR (directories.directory_path >= ? AND directories.directory_path < ?)
+            ''', (root_directory, prefix + '/', prefix + '0'))
+        else:
+            rows = self._read('''
+            SELECT directories.directory_path, files.filename,
+                   CASE WHEN files.file_type = 0 OR file_metadata.metadata_id IS NOT NULL THEN files.mtime_ns END,
+                   files.byte_size, files.inode
+              FROM files JOIN directories ON files.directory_id = directories.directory_id
+              LEFT JOIN file_metadata ON file_metadata.file_id = files.file_id AND file_metadata.meta_key = ?
+             WHERE directories.directory_path = ?
+                OR (directories.directory_path >= ? AND directories.directory_path < ?)
+            ''', (required_key, root_directory, prefix + '/', prefix + '0'))
+        return {
+            os.path.join(directory_path, filename): (mtime_ns, size, inode)
+            for directory_path, filename, mtime_ns, size, inode in rows
+        }
+
+    # find files whose full path contains every whitespace separated term of
+    # query, case insensitive. Terms of 3+ characters go through the trigram
+    # index, shorter ones are checked with LIKE on the candidates. The
+    # shortest paths come first, usually the most specific hits; when more
+    # than SEARCH_FILES_CANDIDATES paths match only those found first are
+    # ordered, sorting every match of a broad query takes too long
+    def search_files(self, query, limit=50):
+        terms = query.split()
+        if not terms:
+            return []
+        indexed = [term for term in terms if len(term) >= 3]
+        short = [term for term in terms if len(term) < 3]
+        conditions, params = [], []
+        if indexed:
+            conditions.append('file_paths MATCH ?')
+            params.append(' '.join('"{}"'.format(term.replace('"', '""')) for term in indexed))
+        for term in short:
+            conditions.append("path LIKE ? ESCAPE '\\'")
+            params.append('%{}%'.format(term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')))
+        rows = self._read(f'''
+        SELECT path FROM file_paths
+         WHERE {' AND '.join(conditions)}
+         LIMIT ?''', params + [max(limit, SEARCH_FILES_CANDIDATES)])
+        return sorted((row[0] for row in rows), key=len)[:limit]
+
+    # list every recorded directory path
+    def get_directories(self):
+        return [row[0] for row in self._read('SELECT directory_path FROM directories')]
+
+    # remove files (and their metadata) by full path
+    def delete_files(self, paths):
+        with self.lock:
+            cursor = self.cursor
+            # also written by earlier opens with metadata_fields declared
+            has_fields = bool(self.fields) or cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'file_fields'").fetchone() is not None
+            for path in paths:
+                cursor.execute('''
+                SELECT file_id FROM files JOIN directories ON files.directory_id = directories.directory_id
+                 WHERE directories.directory_path = ? AND files.filename = ?
+                ''', (os.path.dirname(path), os.path.basename(path)))
+                file = cursor.fetchone()
+                if file is not None:
+                    cursor.execute('DELETE FROM file_metadata WHERE file_id = ?', (file[0],))
+                    if has_fields:
+                        cursor.execute('DELETE FROM file_fields WHERE file_id = ?', (file[0],))
+                    cursor.execute('DELETE FROM files WHERE file_id = ?', (file[0],))
+            self.conn.commit()
+
+
+# The module level functions below work on a store over dir.sqlite in the
+# working directory, opened on first use
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def default_store():
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = FileStore(DEFAULT_DB_PATH)
+        return _default_store
+
+
+def create_tables():
+    default_store().create_tables()
+
+
+def insert_or_update_file(directory_path, filename, file_type, file_size, creation_date, metadata_dict,
+                          mtime_ns=None, inode=None):
+    default_store().insert_or_update_file(directory_path, filename, file_type, file_size, creation_date,
+                                          metadata_dict, mtime_ns=mtime_ns, inode=inode)
+
+
+def upsert_files(records, batch_size=UPSERT_BATCH_SIZE):
+    return default_store().upsert_files(records, batch_size=batch_size)
+
+
+def get_file_snapshots(root_directory, required_key=None):
+    return default_store().get_file_snapshots(root_directory, required_key)
+
+
+def get_directories():
+    return default_store().get_directories()
+
 
-    conn.commit()
+def search_files(query, limit=50):
+    return default_store().search_files(query, limit)
 
 
+def delete_files(paths):
+    default_store().delete_files(paths)
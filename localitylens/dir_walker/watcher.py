@@ -0,0 +1,295 @@
+"""
+    Keep the file index fresh from inotify events instead of periodic full walks
+
+    Linux only, inotify is called through ctypes so no extra dependency is
+    needed. When the kernel runs out of watches (fs.inotify.max_user_watches)
+    or drops events (IN_Q_OVERFLOW) the watcher falls back to incremental
+    rescans with index.update_index.
+"""
+import os
+import time
+import errno
+import ctypes
+import select
+import struct
+import ctypes.util
+from localitylens.dir_walker import storage
+from localitylens.dir_walker.ignore import compile_ignore
+from localitylens.dir_walker.index import stat_metadata, update_index
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+REMOVED_MASK = IN_DELETE | IN_MOVED_FROM | IN_DELETE_SELF | IN_MOVE_SELF
+
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+EVENT_HEADER = struct.Struct('iIII')
+EVENT_BUFFER_SIZE = 64 * 1024
+
+UPSERT = 1
+DELETE = 0
+
+
+class Inotify():
+    """Minimal ctypes binding of inotify_init1/inotify_add_watch."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.watches = {}  # wd -> directory path
+        self.paths = {}  # directory path -> wd
+
+    def add_watch(self, path):
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        self.watches[wd] = path
+        self.paths[path] = wd
+        return wd
+
+    def forget(self, wd, path):
+        # after a rename the same wd may be registered under the new path
+        # already, only the mappings that still point at each other go
+        if self.watches.get(wd) == path:
+            del self.watches[wd]
+        if self.paths.get(path) == wd:
+            del self.paths[path]
+
+    def forget_tree(self, path):
+        """Forget the watches of path and every directory recorded below it."""
+        prefix = path.rstrip('/') + '/'
+        for watched in [watched for watched in self.paths if watched == path or watched.startswith(prefix)]:
+            self.forget(self.paths[watched], watched)
+
+    def read_events(self, timeout=None):
+        """Wait up to timeout seconds and return a list of (path, mask, wd)."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, EVENT_BUFFER_SIZE)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                events.append((None, mask, wd))
+                continue
+            directory = self.watches.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                # the kernel dropped the watch, the directory is gone
+                self.forget(wd, directory)
+                continue
+            events.append((os.path.join(directory, os.fsdecode(name)) if name else directory, mask, wd))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class DirectoryWatcher():
+    """Watch indexed directories and push debounced changes into storage.
+
+    Events are coalesced per path and flushed once no event arrived for
+    `debounce` seconds (or `max_pending` paths piled up). Every flush writes
+    to storage and then calls on_upsert(records) / on_delete(paths), records
+    being the tuples returned by index.scan_changes, so a Pipeline can be kept
+    in sync from there.
+
+    store is a storage.FileStore, by default the one over dir.sqlite. Its
+    writer is shared between threads, so the watcher can run in its own.
+    """
+
+    def __init__(self, ignore_patterns, roots=None, metadata_fn=None, on_upsert=None, on_delete=None,
+                 debounce=1.0, max_pending=10000, rescan_interval=300, store=None):
+        self.store = store if store is not None else storage.default_store()
+        self.matcher = compile_ignore(ignore_patterns)
+        self.directories = roots if roots is not None else self.store.get_directories()
+        self.roots = self._top_level(self.directories)
+        self.metadata_fn = metadata_fn
+        self.on_upsert = on_upsert
+        self.on_delete = on_delete
+        self.debounce = debounce
+        self.max_pending = max_pending
+        self.rescan_interval = rescan_interval
+        self.inotify = Inotify()
+        self.pending = {}
+        # set once the kernel refused a watch, from then on changes below
+        # unwatched directories are only picked up by periodic rescans
+        self.exhausted = False
+        self.overflowed = False
+
+    @staticmethod
+    def _top_level(directories):
+        roots = []
+        for directory in sorted(set(directories)):
+            if not roots or not directory.startswith(roots[-1].rstrip('/') + '/'):
+                roots.append(directory)
+        return roots
+
+    def _ignored(self, path, is_dir):
+        if self.matcher.match(path):
+            return True
+        if not self.matcher.ignore_files:
+            return False
+        for root in self.roots:
+            if path.startswith(root.rstrip('/') + '/'):
+                rules = self.matcher.rules_below(root, os.path.dirname(path))
+                return self.matcher.ignored(path, is_dir, rules)
+        return False
+
+    def watch(self, directory):
+        if self.exhausted or directory in self.inotify.paths:
+            return
+        try:
+            self.inotify.add_watch(directory)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                self.exhausted = True
+            elif e.errno not in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                raise
+
+    def watch_tree(self, directory, mark_pending=False):
+        """Watch directory and every directory below it.
+
+        With mark_pending every entry found is queued as an upsert, this
+        catches files created in a new directory before its watch existed.
+        """
+        stack = [directory]
+        while stack:
+            root = stack.pop()
+            self.watch(root)
+            try:
+                entries = list(os.scandir(root))
+            except (FileNotFoundError, NotADirectoryError, PermissionError):
+                continue
+            for entry in entries:
+                if self._ignored(entry.path, entry.is_dir(follow_symlinks=False)):
+                    continue
+                if mark_pending:
+                    self.pending[entry.path] = UPSERT
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+
+    def start(self):
+        for directory in self.directories:
+            self.watch(directory)
+        for root in self.roots:
+            self.watch_tree(root)
+
+    def handle(self, path, mask, wd=None):
+        if path is None:
+            self.overflowed = True
+            return
+        if self._ignored(path, bool(mask & IN_ISDIR)):
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            # the watch of a renamed directory was read after the rename was
+            # handled and already follows the directory to its new path
+            if os.path.lexists(path):
+                return
+            self.inotify.forget(wd, path)
+        elif mask & IN_ISDIR and mask & (IN_DELETE | IN_MOVED_FROM):
+            # drop the old paths, so a directory re-created there is watched
+            # again; a directory moved within the tree is re-watched on IN_MOVED_TO
+            self.inotify.forget_tree(path)
+        if mask & REMOVED_MASK:
+            self.pending[path] = DELETE
+        else:
+            self.pending[path] = UPSERT
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.watch_tree(path, mark_pending=True)
+
+    def flush(self):
+        records, deleted = [], set()
+        for path, action in self.pending.items():
+            if action == UPSERT:
+                try:
+                    stats = os.stat(path)
+                except OSError:
+                    # like index.scan_changes: a dangling or looping symlink
+                    # is recorded with its own stat, anything else is gone
+                    try:
+                        stats = os.lstat(path)
+                    except OSError:
+                        action = DELETE
+                if action == UPSERT:
+                    owner, creation_date, modified_date, size = stat_metadata(stats)
+                    is_dir = os.path.isdir(path)
+                    records.append((path, 0 if is_dir else 1, owner, creation_date, modified_date, size,
+                                    stats.st_mtime_ns, stats.st_ino))
+            if action == DELETE:
+                deleted.add(path)
+                # a removed directory takes everything recorded below it along
+                deleted.update(self.store.get_file_snapshots(path))
+        # cleared only now, an error above leaves every change pending
+        self.pending = {}
+        if deleted:
+            self.store.delete_files(sorted(deleted))
+            if self.on_delete is not None:
+                self.on_delete(sorted(deleted))
+        self.store.upsert_files(
+            (os.path.dirname(path), os.path.basename(path), item_type, size, creation_date,
+             self.metadata_fn(path) if self.metadata_fn is not None and item_type else {}, mtime_ns, inode)
+            for path, item_type, owner, creation_date, modified_date, size, mtime_ns, inode in records)
+        if records and self.on_upsert is not None:
+            self.on_upsert(records)
+
+    def rescan(self):
+        self.overflowed = False
+        for root in self.roots:
+            added, modified, deleted = update_index(root, self.matcher, self.metadata_fn, store=self.store)
+            if deleted and self.on_delete is not None:
+                self.on_delete(deleted)
+            if (added or modified) and self.on_upsert is not None:
+                self.on_upsert(added + modified)
+
+    def run(self, stop_event=None):
+        """Process events until stop_event (a threading.Event) is set."""
+        self.start()
+        last_event = last_rescan = time.monotonic()
+        try:
+            while stop_event is None or not stop_event.is_set():
+                events = self.inotify.read_events(timeout=self.debounce)
+                now = time.monotonic()
+                for path, mask, wd in events:
+                    self.handle(path, mask, wd)
+                if events:
+                    last_event = now
+                if self.pending and (now - last_event >= self.debounce or len(self.pending) >= self.max_pending):
+                    self.flush()
+                if self.overflowed or (self.exhausted and now - last_rescan >= self.rescan_interval):
+                    self.pending = {}
+                    self.rescan()
+                    last_rescan = now
+        finally:
+            if self.pending:
+                self.flush()
+            self.inotify.close()
@@ -0,0 +1,111 @@
+"""
+    asyncio front-end for Pipeline
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from .filters import filter_key
+from .result_cache import copy_result
+
+
+class AsyncPipeline():
+    """Run Pipeline searches and inserts off the event loop.
+
+    Searches run on up to `max_workers` threads (by default one per read
+    connection of the pipeline), inserts on a single writer thread so they
+    are applied in call order.
+
+    Identical searches in flight at the same time share one execution,
+    every caller gets its own copy of the result.
+    Searches given the same `channel` supersede each other: a new one
+    cancels the previous, which raises asyncio.CancelledError to its caller
+    and never reaches SQLite if it was still waiting for a worker. This is
+    meant for type-ahead, one channel per input box. Repeating the search
+    in progress on a channel (the same text sent again) joins it instead.
+    """
+
+    def __init__(self, pipeline, max_workers=None):
+        self.pipeline = pipeline
+        if max_workers is None:
+            max_workers = pipeline.read_pool.size if pipeline.read_pool is not None else 1
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='localitylens-search')
+        self.write_executor = ThreadPoolExecutor(1, thread_name_prefix='localitylens-write')
+        self._slots = None
+        self._in_flight = {}  # search key -> [task, number of waiters]
+        self._channels = {}  # channel -> (search key, task) of its latest search
+
+    async def search(self, query, embedding=None, top_k=30, fusion=None, weights=None, candidate_k=None,
+                     filters=None, channel=None):
+        """Same arguments and result as Pipeline.search."""
+        key = (query, None if embedding is None else embedding.tobytes(), top_k, fusion,
+               None if weights is None else tuple(sorted(weights.items())), candidate_k, filter_key(filters))
+        fn = functools.partial(self.pipeline.search, query, embedding, top_k=top_k, fusion=fusion,
+                               weights=weights, candidate_k=candidate_k, filters=filters)
+        if channel is None:
+            return await self._coalesced(key, fn)
+        previous = self._channels.get(channel)
+        if previous is not None and previous[0] == key and not previous[1].done():
+            # shielded so this caller going away leaves the earlier one alone
+            return copy_result(await asyncio.shield(previous[1]))
+        if previous is not None:
+            previous[1].cancel()
+        entry = (key, asyncio.ensure_future(self._coalesced(key, fn)))
+        self._channels[channel] = entry
+        try:
+            return await entry[1]
+        finally:
+            if self._channels.get(channel) is entry:
+                del self._channels[channel]
+
+    async def insert(self, row, embedding, text_col, link_col, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.write_executor, functools.partial(
+            self.pipeline.insert, row, embedding, text_col, link_col, **kwargs))
+
+    async def insert_many(self, rows, embeddings, text_col, link_col, **kwargs):
+        """Same arguments and result as Pipeline.insert_many.
+
+        rows may be a generator, it is consumed on the writer thread.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.write_executor, functools.partial(
+            self.pipeline.insert_many, rows, embeddings, text_col, link_col, **kwargs))
+
+    async def _run(self, fn):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        # waiting here rather than in the executor queue lets a superseded
+        # search be dropped before it ever runs
+        async with self._slots:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn)
+
+    async def _coalesced(self, key, fn):
+        entry = self._in_flight.get(key)
+        if entry is None or entry[0].done():
+            task = asyncio.ensure_future(self._run(fn))
+            entry = [task, 0]
+            self._in_flight[key] = entry
+
+            def forget(_):
+                if self._in_flight.get(key) is entry:
+                    del self._in_flight[key]
+            task.add_done_callback(forget)
+        entry[1] += 1
+        try:
+            # shielded so one waiter going away doesn't cancel the others
+            return copy_result(await asyncio.shield(entry[0]))
+        except asyncio.CancelledError:
+            if entry[1] == 1:
+                entry[0].cancel()
+                # a cancelled task is only done once the loop got to it,
+                # later callers must not join it meanwhile
+                if self._in_flight.get(key) is entry:
+                    del self._in_flight[key]
+            raise
+        finally:
+            entry[1] -= 1
+
+    def close(self, wait=True):
+        self.executor.shutdown(wait=wait)
+        self.write_executor.shutdown(wait=wait)
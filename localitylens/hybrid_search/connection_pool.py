@@ -0,0 +1,69 @@
+"""
+    Pool of read-only connections for concurrent searches
+"""
+import os
+import queue
+import pathlib
+import threading
+from contextlib import contextmanager
+
+
+def data_version(conn):
+    return conn.execute('PRAGMA data_version').fetchone()[0]
+
+
+def read_only_uri(path):
+    # as_uri percent-escapes the path, a '?' or '#' in a directory name would
+    # otherwise start the query string or fragment of the URI
+    return pathlib.Path(os.path.abspath(path)).as_uri() + '?mode=ro'
+
+
+class ConnectionPool():
+    """At most `size` connections created by `connect()`, handed out one per caller.
+
+    vss0 keeps its faiss index in memory per connection, so a connection
+    that has not seen the latest commit would keep returning stale vector
+    hits. PRAGMA data_version changes once another connection committed,
+    idle connections for which it did are closed and opened again.
+    """
+
+    def __init__(self, connect, size=4):
+        self.connect = connect
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+        self.closed = False
+
+    def _open(self):
+        conn = self.connect()
+        return conn, data_version(conn)
+
+    @contextmanager
+    def connection(self):
+        if self.closed:
+            raise RuntimeError('connection pool is closed')
+        with self.slots:
+            try:
+                conn, version = self.idle.get_nowait()
+            except queue.Empty:
+                conn, version = self._open()
+            else:
+                if data_version(conn) != version:
+                    conn.close()
+                    conn, version = self._open()
+            try:
+                yield conn
+            finally:
+                if self.closed:
+                    conn.close()
+                else:
+                    self.idle.put((conn, version))
+
+    def close(self):
+        self.closed = True
+        while True:
+            try:
+                conn, _ = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            conn.close()
@@ -0,0 +1,76 @@
+"""
+    Content addressed embedding cache stored in a side table of the index db
+"""
+import hashlib
+import numpy as np
+from .utils import chunks
+
+# keys per lookup, stays below SQLite's bound parameter limit
+LOOKUP_BATCH_SIZE = 900
+
+
+class EmbeddingCache():
+    """Maps sha256(model id + text) to its float32 embedding.
+
+    The model id is part of the key so switching models never returns
+    vectors computed by another one.
+    """
+
+    def __init__(self, conn, table_name, model_id):
+        self.conn = conn
+        self.table_name = table_name
+        self.model_id = model_id
+        self.hits = 0
+        self.misses = 0
+        conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            content_hash BLOB PRIMARY KEY,
+            embedding BLOB NOT NULL
+        ) WITHOUT ROWID;''')
+
+    def key(self, text):
+        return hashlib.sha256(f'{self.model_id}\0{text}'.encode('utf-8')).digest()
+
+    def get_many(self, keys):
+        found = {}
+        for batch in chunks(keys, LOOKUP_BATCH_SIZE):
+            res = self.conn.execute(f'''
+                SELECT content_hash, embedding FROM {self.table_name}
+                 WHERE content_hash IN ({', '.join('?' * len(batch))})''', batch).fetchall()
+            for key, blob in res:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, items):
+        self.conn.executemany(f'INSERT OR REPLACE INTO {self.table_name} (content_hash, embedding) VALUES (?, ?)',
+                              [(key, embedding.tobytes()) for key, embedding in items])
+
+    def embed(self, texts, batch_embedding_fn):
+        """Embed texts, calling batch_embedding_fn once on the texts not seen before.
+
+        Writes go through the shared connection and are committed together
+        with the rows that use them.
+        """
+        keys = [self.key(text) for text in texts]
+        found = self.get_many(list(set(keys)))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key in found or key in missing:
+                self.hits += 1
+            else:
+                missing[key] = text
+                self.misses += 1
+        if missing:
+            embeddings = batch_embedding_fn(list(missing.values()))
+            for key, embedding in zip(missing, embeddings):
+                found[key] = np.asarray(embedding, dtype=np.float32).reshape(-1)
+            self.put_many((key, found[key]) for key in missing)
+        return [found[key] for key in keys]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
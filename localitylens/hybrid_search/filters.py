@@ -0,0 +1,97 @@
+"""
+    Translate search(filters={...}) into SQL over the metadata tables
+"""
+import numbers
+from .metadata_fields import quote
+
+FILTER_OPS = {
+    'eq': '=',
+    'ne': '!=',
+    'gt': '>',
+    'gte': '>=',
+    'lt': '<',
+    'lte': '<=',
+}
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Number)
+
+
+def _condition(op, value, column=None):
+    # meta_value is TEXT, numbers are compared numerically through CAST so
+    # '9' < '10' holds. The CAST can't use the (meta_key, meta_value) index,
+    # every value stored under the key is checked. Typed columns (column
+    # set) compare as stored, through their own index
+    typed = column is not None
+    if op == 'in':
+        values = list(value)
+        if not values:
+            return '0', []
+        if not typed:
+            column = 'CAST(meta_value AS REAL)' if all(_is_number(v) for v in values) else 'meta_value'
+        return f"{column} IN ({', '.join('?' * len(values))})", values
+    if op not in FILTER_OPS:
+        raise ValueError(f"unknown filter operator {op!r}, expected one of {sorted(FILTER_OPS) + ['in']}")
+    if value is None:
+        column = column or 'meta_value'
+        return (f'{column} IS NULL' if op == 'eq' else f'{column} IS NOT NULL'), []
+    if not typed:
+        column = 'CAST(meta_value AS REAL)' if _is_number(value) else 'meta_value'
+    return f'{column} {FILTER_OPS[op]} ?', [value]
+
+
+def metadata_filter(meta_table, filters, fields_table=None, fields=(), main_table=None):
+    """(sql, params) of a SELECT of the row_ids matching every filter.
+
+    filters maps a metadata key to either a value (equality) or a dict of
+    operator -> value with operators eq, ne, gt, gte, lt, lte and in, e.g.
+    {'mime_type': 'application/pdf', 'size_bytes': {'gte': 1024, 'lt': 1 << 20}}.
+    Rows lacking a filtered key never match. On key/value rows comparisons
+    with strings are served by the (meta_key, meta_value) index, numeric
+    ones cast and check every value stored under the key.
+
+    Keys in `fields` are looked up in their typed column of `fields_table`
+    instead, through its index; there {'eq': None} also matches the rows of
+    `main_table` that lack the key.
+    """
+    selects, params = [], []
+    # typed fields share one row per item, their conditions go into a single select
+    typed_conditions, typed_params = [], []
+    missing = False
+    for key, spec in filters.items():
+        if not isinstance(spec, dict):
+            spec = {'eq': spec}
+        if key in fields:
+            for op, value in spec.items():
+                condition, values = _condition(op, value, f'{fields_table}.{quote(key)}')
+                typed_conditions.append(condition)
+                typed_params += values
+                missing = missing or (op == 'eq' and value is None)
+            continue
+        conditions = ['meta_key = ?']
+        params.append(key)
+        for op, value in spec.items():
+            condition, values = _condition(op, value)
+            conditions.append(condition)
+            params += values
+        selects.append(f"SELECT row_id FROM {meta_table} WHERE {' AND '.join(conditions)}")
+    if any(key in fields for key in filters):
+        if missing:
+            if main_table is None:
+                raise ValueError("main_table is required to match missing metadata fields")
+            # items without any typed field have no fields_table row at all
+            source = f'{main_table} LEFT JOIN {fields_table} USING (row_id)'
+        else:
+            source = fields_table
+        selects.insert(0, f"SELECT row_id FROM {source} WHERE {' AND '.join(typed_conditions) or '1'}")
+        params = typed_params + params
+    return ' INTERSECT '.join(selects), params
+
+
+def filter_key(filters):
+    # hashable form of filters for the result cache
+    if not filters:
+        return None
+    return repr(sorted((key, sorted(spec.items()) if isinstance(spec, dict) else spec)
+                       for key, spec in filters.items()))
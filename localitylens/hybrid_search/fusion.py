@@ -0,0 +1,72 @@
+"""
+    Fuse the fts5 bm25 and vss distance rankings into a single score
+
+    Both engines report lower-is-better values, every method below turns
+    them into a higher-is-better score.
+"""
+import math
+
+RRF_K = 60
+FUSION_METHODS = ('rrf', 'minmax', 'zscore')
+
+
+def _by_engine(hits):
+    scores = {}
+    for rowid, data in hits.items():
+        for engine, value in data.items():
+            scores.setdefault(engine, {})[rowid] = value
+    return scores
+
+
+def _min_max(scores):
+    lo, hi = min(scores.values()), max(scores.values())
+    if hi == lo:
+        return {rowid: 1.0 for rowid in scores}
+    return {rowid: (hi - value) / (hi - lo) for rowid, value in scores.items()}
+
+
+def _z_score(scores):
+    mean = sum(scores.values()) / len(scores)
+    std = math.sqrt(sum((value - mean) ** 2 for value in scores.values()) / len(scores))
+    if std == 0:
+        return {rowid: 0.0 for rowid in scores}
+    return {rowid: (mean - value) / std for rowid, value in scores.items()}
+
+
+def reciprocal_rank_fusion(hits, weights, k=RRF_K):
+    fused = {rowid: 0.0 for rowid in hits}
+    for engine, scores in _by_engine(hits).items():
+        weight = weights.get(engine, 1.0)
+        for rank, rowid in enumerate(sorted(scores, key=scores.get), 1):
+            fused[rowid] += weight / (k + rank)
+    return fused
+
+
+def linear_fusion(hits, weights, normalize):
+    fused = {rowid: 0.0 for rowid in hits}
+    for engine, scores in _by_engine(hits).items():
+        weight = weights.get(engine, 1.0)
+        normalized = normalize(scores)
+        # a hit the engine did not return counts as its worst candidate
+        floor = min(normalized.values())
+        for rowid in hits:
+            fused[rowid] += weight * normalized.get(rowid, floor)
+    return fused
+
+
+def fuse(hits, method='rrf', weights=None, rrf_k=RRF_K):
+    """Rank hits, a dict of rowid -> {engine: raw score}, by fused score.
+
+    Returns (rowid, score) tuples sorted best first. `weights` maps engine
+    name ('fts5', 'faiss') to its weight and defaults to 1.0 each.
+    """
+    weights = weights or {}
+    if method == 'rrf':
+        fused = reciprocal_rank_fusion(hits, weights, k=rrf_k)
+    elif method == 'minmax':
+        fused = linear_fusion(hits, weights, _min_max)
+    elif method == 'zscore':
+        fused = linear_fusion(hits, weights, _z_score)
+    else:
+        raise ValueError(f"unknown fusion method {method}, expected one of {FUSION_METHODS}")
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
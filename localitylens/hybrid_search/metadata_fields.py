@@ -0,0 +1,89 @@
+"""
+    Declared metadata fields kept as typed columns of a side table, one row
+    per indexed item, instead of TEXT rows of the key/value metadata table
+"""
+import re
+
+FIELD_TYPES = {
+    int: 'INTEGER',
+    bool: 'INTEGER',
+    float: 'REAL',
+    str: 'TEXT',
+}
+SQL_TYPES = ('INTEGER', 'REAL', 'TEXT')
+
+_IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def quote(name):
+    # field names may be SQL keywords such as group, field_columns has made
+    # sure they hold no quote
+    return f'"{name}"'
+
+
+def field_columns(fields, reserved=()):
+    """{name: SQL type} of a metadata_fields declaration.
+
+    fields maps a metadata key to int, float, str or one of the SQL type
+    names, e.g. {'size_bytes': int, 'mime_type': 'TEXT'}. Keys become column
+    names so they must be plain identifiers.
+    """
+    columns = {}
+    for name, field_type in (fields or {}).items():
+        sql_type = FIELD_TYPES.get(field_type, field_type)
+        if not isinstance(sql_type, str) or sql_type.upper() not in SQL_TYPES:
+            raise ValueError(f"unsupported type {field_type!r} for metadata field {name!r}, "
+                             f"expected int, float, str or one of {SQL_TYPES}")
+        if not _IDENTIFIER.match(name) or name.lower() in reserved:
+            raise ValueError(f"metadata field name {name!r} can't be used as a column name")
+        columns[name] = sql_type.upper()
+    return columns
+
+
+def create_fields_table(cursor, table, id_col, columns):
+    """Create `table` with an indexed column per declared field, adding the
+    ones an existing table lacks. Returns the columns that were added."""
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS {table} ({id_col} INTEGER PRIMARY KEY)')
+    existing = {row[1] for row in cursor.execute(f'PRAGMA table_info({table})')}
+    added = {}
+    for name, sql_type in columns.items():
+        if name not in existing:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {quote(name)} {sql_type}')
+            added[name] = sql_type
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_{name} ON {table}({quote(name)})')
+    return added
+
+
+def migrate_fields(cursor, table, id_col, meta_table, columns):
+    """Move the key/value rows of the declared fields into their columns.
+
+    Column affinity converts numeric text such as '1024' on the way, values
+    that don't look like the declared type are kept as they are. Returns the
+    number of key/value rows moved.
+    """
+    if not columns:
+        return 0
+    names = list(columns)
+    placeholders = ', '.join('?' * len(names))
+    cursor.execute(f'''
+    INSERT OR IGNORE INTO {table} ({id_col})
+    SELECT DISTINCT {id_col} FROM {meta_table} WHERE meta_key IN ({placeholders})''', names)
+    for name in names:
+        cursor.execute(f'''
+        UPDATE {table} SET {quote(name)} = (
+            SELECT meta_value FROM {meta_table}
+             WHERE {meta_table}.{id_col} = {table}.{id_col} AND meta_key = ?)
+         WHERE {id_col} IN (SELECT {id_col} FROM {meta_table} WHERE meta_key = ?)''', (name, name))
+    cursor.execute(f'DELETE FROM {meta_table} WHERE meta_key IN ({placeholders})', names)
+    return cursor.rowcount
+
+
+def split_fields(metadata, columns):
+    """(typed values, remaining key/value pairs) of a metadata dict."""
+    typed, rest = {}, {}
+    for key, value in metadata.items():
+        if key in columns:
+            typed[key] = value
+        else:
+            rest[key] = value
+    return typed, rest
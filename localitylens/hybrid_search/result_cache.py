@@ -0,0 +1,90 @@
+"""
+    LRU + TTL cache of Pipeline.search results
+"""
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+DEFAULT_RESULT_CACHE_SIZE = 256
+DEFAULT_RESULT_CACHE_TTL = 60.0  # seconds
+
+
+def normalize_query(query):
+    # both fts5 tokenizers fold case and split on whitespace, so these
+    # variants return the same hits
+    return ' '.join(query.lower().split())
+
+
+def copy_result(value):
+    # search results are lists of row dicts holding the _score/_raw_score
+    # dicts, everything else in them is a scalar read from SQLite
+    if isinstance(value, dict):
+        return {key: copy_result(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_result(item) for item in value]
+    return value
+
+
+def embedding_key(embedding):
+    if embedding is None:
+        return None
+    return hashlib.blake2b(embedding.tobytes(), digest_size=16).digest()
+
+
+class ResultCache():
+    """Search results tagged with the data generation they were computed at.
+
+    An entry is only returned while the generation passed to get() matches
+    the one it was stored with and it is younger than `ttl` seconds. Results
+    are copied on the way in and out, nested dicts included, so callers may
+    modify them; with copy=False values are stored as is and should be
+    immutable.
+    """
+
+    def __init__(self, maxsize=DEFAULT_RESULT_CACHE_SIZE, ttl=DEFAULT_RESULT_CACHE_TTL, copy=True):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.copy = copy
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, generation, count=True):
+        """Cached value or None, with count=False the lookup is left out of stats()."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                stored_at, stored_generation, result = entry
+                if stored_generation == generation and time.monotonic() - stored_at < self.ttl:
+                    self.entries.move_to_end(key)
+                    if count:
+                        self.hits += 1
+                    return copy_result(result) if self.copy else result
+                del self.entries[key]
+            if count:
+                self.misses += 1
+            return None
+
+    def put(self, key, generation, result):
+        with self.lock:
+            if self.copy:
+                result = copy_result(result)
+            self.entries[key] = (time.monotonic(), generation, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'size': len(self.entries),
+        }
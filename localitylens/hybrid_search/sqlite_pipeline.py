@@ -15,10 +15,44 @@ except AttributeError:
         raise ValueError("your sqlite3 doesn't support load_extension, fallback to sqlean failed\npip install sqlean")
 finally:
     conn.close()
+import os
+import itertools
+import threading
+from contextlib import contextmanager
 import simple_fts5
 import sqlite_vss
-from .utils import chunks
-from localitylens.node_parser.constants import DEFAULT_CHUNK_SIZE
+from .connection_pool import ConnectionPool, read_only_uri
+from .embedding_cache import EmbeddingCache
+from .fusion import fuse
+from .filters import metadata_filter, filter_key
+from .metadata_fields import field_columns, create_fields_table, migrate_fields, split_fields, quote
+from .connection_pool import data_version
+from .result_cache import ResultCache, normalize_query, embedding_key, DEFAULT_RESULT_CACHE_SIZE, DEFAULT_RESULT_CACHE_TTL
+from .utils import chunks, batched, fts5_query, fts5_prefix_query
+from localitylens.node_parser.constants import DEFAULT_CHUNK_SIZE, DEFAULT_EMBED_BATCH_SIZE, DEFAULT_INSERT_BATCH_SIZE
+
+# older SQLite builds cap bound parameters per statement at 999
+SQLITE_MAX_VARIABLES = 900
+DEFAULT_READ_POOL_SIZE = 4
+# shortest prefix search_prefix looks up without fts_prefix indexes
+DEFAULT_MIN_PREFIX = 2
+# prefix matches fetched before ranking, broader prefixes are ranked
+# among the first PREFIX_CANDIDATES matches only
+PREFIX_CANDIDATES = 1000
+# a filtered vss search asks faiss for this many times the hits it expects
+# to need, and as much again each time too few of them pass the filter
+VSS_OVERFETCH = 4
+
+_MISSING = object()
+
+
+def _aligned(rows, embeddings):
+    # zip that raises instead of dropping what's left of the longer side
+    for row, embedding in itertools.zip_longest(rows, embeddings, fillvalue=_MISSING):
+        if row is _MISSING or embedding is _MISSING:
+            raise ValueError('rows and embeddings differ in length')
+        yield row, embedding
+
 
 class Pipeline():
 
@@ -26,26 +60,112 @@ class Pipeline():
                  chunk_index=False,
                  chunk_size=10,
                  use_simple_fts5=False,
+                 embedding_model=None,
+                 embed_batch_size=DEFAULT_EMBED_BATCH_SIZE,
+                 read_pool_size=DEFAULT_READ_POOL_SIZE,
+                 result_cache_size=DEFAULT_RESULT_CACHE_SIZE,
+                 result_cache_ttl=DEFAULT_RESULT_CACHE_TTL,
+                 fts_prefix=None,
+                 metadata_fields=None,
                 ):
-        # Connect to SQLite database and enable extensions (adjust path as needed)
-        self.conn = sqlite3.connect(db_name)
-        self.conn.enable_load_extension(True)
-        sqlite_vss.load(self.conn)  # Load sqlite-vss extension
-        if use_simple_fts5:
-            simple_fts5.load(self.conn) # load chinese tokenizer method
-        self.main_table = prefix_name
+        """
+            embedding_model: identifier of the model behind embedding_fn, when
+                set embeddings are cached by content hash and reused across
+                inserts of identical text
+            embed_batch_size: number of texts handed to batch_embedding_fn
+                per call
+            read_pool_size: number of read-only connections searches run on,
+                so up to that many searches proceed in parallel with each
+                other and with inserts. In-memory databases search through
+                the writer connection instead
+            result_cache_size: number of search results kept, 0 disables the
+                cache. Entries expire after result_cache_ttl seconds and on
+                any commit, from this pipeline or another connection
+            fts_prefix: prefix lengths (in bytes) to build FTS5 prefix indexes
+                for, e.g. (2, 3, 4), which makes search_prefix fast on large
+                tables. Only takes effect when the FTS5 table is created
+            metadata_fields: metadata keys stored as typed, indexed columns
+                instead of TEXT key/value rows, e.g. {'size_bytes': int,
+                'mime_type': str}. They come back from search with their
+                type and filter through the column index. Values already
+                stored under a newly declared key are moved over on open
+        """
+        # str or path-like, like sqlite3.connect
+        self.db_name = db_name = os.fspath(db_name)
         self.use_simple_fts5 = use_simple_fts5
+        # every write goes through this connection, any thread may use it
+        # while holding write_lock
+        self.conn = self._connect()
+        self.write_lock = threading.RLock()
+        self.in_memory = db_name in (':memory:', '') or 'mode=memory' in db_name
+        self.read_pool = None
+        if not self.in_memory:
+            # readers keep seeing the last commit while a batch is written
+            self.conn.execute('PRAGMA journal_mode = WAL')
+            self.conn.execute('PRAGMA synchronous = NORMAL')
+            self.read_pool = ConnectionPool(lambda: self._connect(read_only=True), read_pool_size)
+        # bumped after every write of this pipeline, commits of other
+        # connections show up in the data_version of version_conn
+        self.write_generation = 0
+        self.result_cache = None
+        if result_cache_size > 0:
+            self.result_cache = ResultCache(result_cache_size, result_cache_ttl)
+            # typed text -> rowid bounds of its complete set of prefix matches
+            self.prefix_matches = ResultCache(result_cache_size, result_cache_ttl, copy=False)
+            if not self.in_memory:
+                self.version_conn = sqlite3.connect(db_name, check_same_thread=False)
+                self.version_lock = threading.Lock()
+        self.main_table = prefix_name
         self.meta_table = prefix_name+'_metadata'
         self.faiss_table = prefix_name+'_faiss'
         self.bm25_table = prefix_name+'_fts5'
+        self.fields_table = prefix_name+'_fields'
+        self.fields = field_columns(metadata_fields, reserved=('row_id', ))
         self.embed_dim = embed_dim
         self.chunk_index = chunk_index
         self.chunk_size = chunk_size
+        self.embed_batch_size = embed_batch_size
+        self.fts_prefix = tuple(fts_prefix) if fts_prefix else ()
+        self.min_prefix = min(self.fts_prefix) if self.fts_prefix else DEFAULT_MIN_PREFIX
         if chunk_index:
             self.chunk_table = prefix_name+'_chunk'
-            from node_parser.text.utils import split_by_sentence_tokenizer
+            from localitylens.node_parser.text.utils import split_by_sentence_tokenizer
             self.splitter = split_by_sentence_tokenizer()
-        self.init_schema()
+        self.init_schema(chunk_index)
+        self.embedding_cache = None
+        if embedding_model is not None:
+            self.embedding_cache = EmbeddingCache(self.conn, prefix_name+'_embed_cache', embedding_model)
+
+    def _connect(self, read_only=False):
+        # Connect to SQLite database and enable extensions
+        if read_only:
+            conn = sqlite3.connect(read_only_uri(self.db_name), uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.db_name, check_same_thread=False)
+        conn.enable_load_extension(True)
+        sqlite_vss.load(conn)  # Load sqlite-vss extension
+        if self.use_simple_fts5:
+            simple_fts5.load(conn) # load chinese tokenizer method
+        return conn
+
+    def close(self):
+        if self.read_pool is not None:
+            self.read_pool.close()
+        if self.result_cache is not None and not self.in_memory:
+            with self.version_lock:
+                self.version_conn.close()
+        with self.write_lock:
+            self.conn.close()
+
+    @contextmanager
+    def read_connection(self):
+        """A connection to run queries on, from the read pool when there is one."""
+        if self.read_pool is None:
+            with self.write_lock:
+                yield self.conn
+        else:
+            with self.read_pool.connection() as conn:
+                yield conn
 
     def init_schema(self, chunk_index=False):
         conn = self.conn
@@ -64,26 +184,45 @@ class Pipeline():
             meta_value TEXT,
             FOREIGN KEY (row_id) REFERENCES {self.main_table}(row_id)
         );''')
+        conn.execute(f'''
+        CREATE INDEX IF NOT EXISTS idx_{self.meta_table}_row_id ON {self.meta_table}(row_id, meta_key);
+        ''')
+        # serves the metadata filters of search
+        conn.execute(f'''
+        CREATE INDEX IF NOT EXISTS idx_{self.meta_table}_key_value ON {self.meta_table}(meta_key, meta_value);
+        ''')
+        if self.fields:
+            added = create_fields_table(conn.cursor(), self.fields_table, 'row_id', self.fields)
+            migrate_fields(conn.cursor(), self.fields_table, 'row_id', self.meta_table, added)
+            conn.commit()
+        # a fields table written by an earlier open with metadata_fields is
+        # still cleaned up on delete when they aren't declared now
+        self.has_fields_table = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                             (self.fields_table, )).fetchone() is not None
 
         conn.execute(f'''
         CREATE VIRTUAL TABLE IF NOT EXISTS {self.faiss_table} USING vss0(
             ctx_embedding({self.embed_dim})
         );
         ''')
+        # e.g. prefix='2 3 4', extra indexes that serve "par"* queries
+        prefix_option = ''
+        if self.fts_prefix:
+            prefix_option = ",\n                prefix='{}'".format(' '.join(str(length) for length in self.fts_prefix))
         if self.use_simple_fts5:
             conn.execute(f'''
             CREATE VIRTUAL TABLE IF NOT EXISTS {self.bm25_table} USING fts5(
                 content,
                 content='{self.main_table}',
                 content_rowid='row_id',
-                tokenize="simple"
+                tokenize="simple"{prefix_option}
             );''')
         else:
             conn.execute(f'''
             CREATE VIRTUAL TABLE IF NOT EXISTS {self.bm25_table} USING fts5(
                 content,
                 content='{self.main_table}',
-                content_rowid='row_id'
+                content_rowid='row_id'{prefix_option}
             );''')
 
         if chunk_index:
@@ -96,7 +235,19 @@ class Pipeline():
             conn.execute(f'''
             CREATE INDEX IF NOT EXISTS idx_row_id ON {self.chunk_table}(row_id);
             ''')
+        # triggers of older databases removed fts5 entries with a plain
+        # DELETE/UPDATE, which an external content table can't serve once the
+        # content row changed, and in chunk mode removed an unrelated chunk
+        for name, sql in conn.execute(f'''
+                SELECT name, sql FROM sqlite_master
+                 WHERE type = 'trigger' AND name IN ('update_{self.bm25_table}_trg', 'del_{self.bm25_table}_trg')
+                ''').fetchall():
+            if chunk_index or "'delete'" not in sql:
+                conn.execute(f'DROP TRIGGER {name}')
 
+        if not chunk_index:
+            # in chunk mode insert() feeds the FTS5 table chunk by chunk and
+            # delete_many() removes the chunks, otherwise it mirrors the main table
             # Trigger to update FTS5 table on insert
             conn.execute(f'''
             CREATE TRIGGER IF NOT EXISTS insert_{self.bm25_table}_trg AFTER INSERT ON {self.main_table}
@@ -109,19 +260,92 @@ class Pipeline():
             conn.execute(f'''
             CREATE TRIGGER IF NOT EXISTS update_{self.bm25_table}_trg AFTER UPDATE ON {self.main_table}
             BEGIN
-                UPDATE {self.bm25_table} SET content = new.content WHERE rowid = old.row_id;
+                INSERT INTO {self.bm25_table}({self.bm25_table}, rowid, content) VALUES ('delete', old.row_id, old.content);
+                INSERT INTO {self.bm25_table}(rowid, content) VALUES (new.row_id, new.content);
             END;
             ''')
 
-        # Trigger to delete from FTS5 table on delete
-        conn.execute(f'''
-        CREATE TRIGGER IF NOT EXISTS del_{self.bm25_table}_trg AFTER DELETE ON {self.main_table}
-        BEGIN
-            DELETE FROM {self.bm25_table} WHERE rowid = old.row_id;
-        END;
-        ''')
+            # Trigger to delete from FTS5 table on delete
+            conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS del_{self.bm25_table}_trg AFTER DELETE ON {self.main_table}
+            BEGIN
+                INSERT INTO {self.bm25_table}({self.bm25_table}, rowid, content) VALUES ('delete', old.row_id, old.content);
+            END;
+            ''')
+        conn.commit()
+
+    def insert(self, row, embedding, text_col, link_col, embedding_fn=None, batch_embedding_fn=None):
+        with self.write_lock:
+            try:
+                row_id = self._insert(row, embedding, text_col, link_col, embedding_fn, batch_embedding_fn)
+            except Exception:
+                self.conn.rollback()
+                raise
+            self.write_generation += 1
+            return row_id
+
+    def upsert(self, row, embedding, text_col, link_col, embedding_fn=None, batch_embedding_fn=None):
+        """`insert` that first removes the row stored under the same link, if
+        any, in the same transaction. The new row gets a new row id."""
+        with self.write_lock:
+            try:
+                self._delete(self.conn.cursor(), [row[link_col]])
+                row_id = self._insert(row, embedding, text_col, link_col, embedding_fn, batch_embedding_fn)
+            except Exception:
+                self.conn.rollback()
+                raise
+            self.write_generation += 1
+            return row_id
+
+    def delete(self, link):
+        """Remove the row stored under link, returns whether there was one."""
+        return self.delete_many([link]) > 0
+
+    def delete_many(self, links):
+        """Remove the rows stored under links along with their fts5 entries,
+        vectors, chunks and metadata in one transaction. Unknown links are
+        skipped, returns the number of rows removed."""
+        with self.write_lock:
+            try:
+                count = self._delete(self.conn.cursor(), list(links))
+            except Exception:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+            self.write_generation += 1
+        return count
 
-    def insert(self, row, embedding, text_col, link_col, embedding_fn=None):
+    def _delete(self, cursor, links):
+        row_ids = [row_id for row_id, in self._select_in(cursor,
+                f'SELECT row_id FROM {self.main_table} WHERE link IN ({{}})', links)]
+        if not row_ids:
+            return 0
+        if self.chunk_index:
+            # the fts5 table isn't backed by the chunk table, the 'delete'
+            # command needs the indexed text to find the entries to drop
+            paragraphs = list(self._select_in(cursor,
+                    f'SELECT chunk_id, paragraph FROM {self.chunk_table} WHERE row_id IN ({{}})', row_ids))
+            cursor.executemany(f"INSERT INTO {self.bm25_table}({self.bm25_table}, rowid, content) VALUES ('delete', ?, ?)",
+                               paragraphs)
+            vss_ids = [chunk_id for chunk_id, _ in paragraphs]
+            self._delete_in(cursor, self.chunk_table, 'row_id', row_ids)
+        else:
+            vss_ids = row_ids
+        # vss0 removes the vectors of one statement from faiss together, a
+        # statement per rowid rescans the index every time
+        self._delete_in(cursor, self.faiss_table, 'rowid', vss_ids)
+        self._delete_in(cursor, self.meta_table, 'row_id', row_ids)
+        if self.has_fields_table:
+            self._delete_in(cursor, self.fields_table, 'row_id', row_ids)
+        # the delete trigger drops the fts5 entries outside chunk mode
+        self._delete_in(cursor, self.main_table, 'row_id', row_ids)
+        return len(row_ids)
+
+    def _delete_in(self, cursor, table, column, ids):
+        for batch in chunks(ids, SQLITE_MAX_VARIABLES):
+            cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({', '.join('?' * len(batch))})", batch)
+
+    def _insert(self, row, embedding, text_col, link_col, embedding_fn=None, batch_embedding_fn=None):
         cursor = self.conn.cursor()
         content = row[text_col]
         link = row[link_col]
@@ -137,33 +361,24 @@ class Pipeline():
         row_id = cursor.lastrowid
         # trigger fts5 insertion or manually if chunk_index
         if self.chunk_index:
-            sentences = self.splitter(content)
-            prev = ''
-            for paragraph in chunks(sentences, self.chunk_size):
-                _content = prev+'\n'.join([sent.strip() for sent in paragraph])
-                if len(_content) <= DEFAULT_CHUNK_SIZE:
-                    prev = _content
-                    continue
-                cursor.execute(f'INSERT INTO {self.chunk_table} (row_id, paragraph) VALUES (?, ?)', (row_id, _content))
-                chunk_id = cursor.lastrowid
-                cursor.execute(f'INSERT INTO {self.bm25_table} (rowid, content) VALUES (?, ?)', (chunk_id, _content))
-                _embedding = embedding_fn(_content)
-                cursor.execute(f'INSERT INTO {self.faiss_table} (rowid, ctx_embedding) VALUES (?, ?)', 
-                            ( chunk_id, _embedding.tobytes() ))
-                prev = ''
-            if len(prev) > 0:
-                _content = prev
+            paragraphs = self._split_chunks(content)
+            for _content, _embedding in zip(paragraphs, self._embed(paragraphs, embedding_fn, batch_embedding_fn)):
                 cursor.execute(f'INSERT INTO {self.chunk_table} (row_id, paragraph) VALUES (?, ?)', (row_id, _content))
                 chunk_id = cursor.lastrowid
                 cursor.execute(f'INSERT INTO {self.bm25_table} (rowid, content) VALUES (?, ?)', (chunk_id, _content))
-                _embedding = embedding_fn(_content)
                 cursor.execute(f'INSERT INTO {self.faiss_table} (rowid, ctx_embedding) VALUES (?, ?)', 
                             ( chunk_id, _embedding.tobytes() ))
 
         else:
+            if embedding is None:
+                embedding = self._embed([content], embedding_fn, batch_embedding_fn)[0]
             cursor.execute(f'INSERT INTO {self.faiss_table} (rowid, ctx_embedding) VALUES (?, ?)', 
                         ( row_id, embedding.tobytes() ))
-        for key in metadata_fields:
+        typed, _ = split_fields({key: row[key] for key in metadata_fields}, self.fields)
+        if typed:
+            cursor.execute(f'''INSERT INTO {self.fields_table} (row_id, {', '.join(map(quote, typed))})
+                VALUES ({', '.join('?' * (len(typed) + 1))})''', (row_id, *typed.values()))
+        for key in metadata_fields.difference(typed):
             value = row[key]
             cursor.execute(f'SELECT metadata_id FROM {self.meta_table} WHERE row_id = ? AND meta_key = ?', (row_id, key))
             metadata = cursor.fetchone()
@@ -176,48 +391,415 @@ class Pipeline():
         self.conn.commit()
         return row_id
 
+    def insert_many(self, rows, embeddings, text_col, link_col, embedding_fn=None,
+                    batch_embedding_fn=None, batch_size=DEFAULT_INSERT_BATCH_SIZE):
+        """Bulk version of `insert`, committing once every `batch_size` rows.
+
+        `embeddings` is either an iterable of vectors aligned with `rows` or a
+        (N, embed_dim) numpy array. It can be None when `embedding_fn` or
+        `batch_embedding_fn` (List[str] -> (n, embed_dim) array) is given,
+        rows are then embedded (or looked up in the embedding cache) per
+        batch; in chunk mode the chunks of every row in the batch are
+        embedded that way together.
+        Returns the row ids of the inserted rows in input order.
+        """
+        return self._write_batches(rows, embeddings, text_col, link_col, embedding_fn, batch_embedding_fn,
+                                   batch_size)
+
+    def upsert_many(self, rows, embeddings, text_col, link_col, embedding_fn=None,
+                    batch_embedding_fn=None, batch_size=DEFAULT_INSERT_BATCH_SIZE):
+        """Bulk version of `upsert`: `insert_many` where the rows already
+        stored under the links of a batch are removed in that batch's
+        transaction. A link must not repeat within one batch."""
+        return self._write_batches(rows, embeddings, text_col, link_col, embedding_fn, batch_embedding_fn,
+                                   batch_size, replace=True)
+
+    def _write_batches(self, rows, embeddings, text_col, link_col, embedding_fn, batch_embedding_fn,
+                       batch_size, replace=False):
+        if embeddings is None:
+            pairs = zip(rows, itertools.repeat(None))
+        else:
+            if hasattr(rows, '__len__') and hasattr(embeddings, '__len__') and len(rows) != len(embeddings):
+                raise ValueError(f'got {len(rows)} rows but {len(embeddings)} embeddings')
+            pairs = _aligned(rows, embeddings)
+        row_ids = []
+        for batch in batched(pairs, batch_size):
+            with self.write_lock:
+                try:
+                    row_ids += self._insert_batch(batch, text_col, link_col, embedding_fn, batch_embedding_fn,
+                                                  replace)
+                except Exception:
+                    self.conn.rollback()
+                    raise
+                self.conn.commit()
+                self.write_generation += 1
+        return row_ids
+
+    def _insert_batch(self, batch, text_col, link_col, embedding_fn=None, batch_embedding_fn=None, replace=False):
+        # ids are assigned here instead of read back from lastrowid so every
+        # table can be written with a single executemany. Rows and chunks get
+        # ids relative to the batch first, embedding happens before the
+        # database is locked
+        main_rows, meta_rows, field_rows, chunk_rows, fts_rows = [], [], [], [], []
+        vss_ids, vss_embeddings, pending_ids, pending_texts = [], [], [], []
+        chunk_id = 0
+        for row_id, (row, embedding) in enumerate(batch, 1):
+            content = row[text_col]
+            if self.chunk_index:
+                main_rows.append((row_id, row[link_col], content[:1024]))
+                for _content in self._split_chunks(content):
+                    chunk_id += 1
+                    chunk_rows.append((chunk_id, row_id, _content))
+                    fts_rows.append((chunk_id, _content))
+                    pending_ids.append(chunk_id)
+                    pending_texts.append(_content)
+            else:
+                main_rows.append((row_id, row[link_col], content))
+                if embedding is None:
+                    pending_ids.append(row_id)
+                    pending_texts.append(content)
+                else:
+                    vss_ids.append(row_id)
+                    vss_embeddings.append(embedding)
+            fields = {}
+            for key, value in row.items():
+                if key in self.fields:
+                    fields[key] = value
+                elif key not in (link_col, text_col):
+                    meta_rows.append((row_id, key, value))
+            if fields:
+                # absent fields are NULL, like a missing key/value row
+                field_rows.append((row_id, *(fields.get(name) for name in self.fields)))
+        # texts without a precomputed embedding are embedded for the whole batch at once
+        vss_ids += pending_ids
+        embedded = self._embed(pending_texts, embedding_fn, batch_embedding_fn)
+        if len(embedded) != len(pending_texts):
+            raise ValueError(f'got {len(embedded)} embeddings for {len(pending_texts)} texts')
+        vss_embeddings += embedded
 
-    def search(self, query, embedding=None, top_k=30):
-        row_ids = {}
         cursor = self.conn.cursor()
+        # take the write lock of the database before reading the last ids,
+        # another process writing the same file can't claim them meanwhile
+        if not self.conn.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE')
+        if replace:
+            self._delete(cursor, [row[link_col] for row, _ in batch])
+        row_base = self._last_id(cursor, self.main_table, 'row_id')
+        vss_base = row_base
+        if self.chunk_index:
+            chunk_base = vss_base = self._last_id(cursor, self.chunk_table, 'chunk_id')
+        cursor.executemany(f'INSERT INTO {self.main_table} (row_id, link, content) VALUES (?, ?, ?)',
+                           [(row_base + row_id, link, content) for row_id, link, content in main_rows])
+        if self.chunk_index:
+            cursor.executemany(f'INSERT INTO {self.chunk_table} (chunk_id, row_id, paragraph) VALUES (?, ?, ?)',
+                               [(chunk_base + chunk_id, row_base + row_id, paragraph)
+                                for chunk_id, row_id, paragraph in chunk_rows])
+            cursor.executemany(f'INSERT INTO {self.bm25_table} (rowid, content) VALUES (?, ?)',
+                               [(chunk_base + chunk_id, content) for chunk_id, content in fts_rows])
+        cursor.executemany(f'INSERT INTO {self.faiss_table} (rowid, ctx_embedding) VALUES (?, ?)',
+                           [(vss_base + rowid, embedding.tobytes()) for rowid, embedding in zip(vss_ids, vss_embeddings)])
+        cursor.executemany(f'INSERT INTO {self.meta_table} (row_id, meta_key, meta_value) VALUES (?, ?, ?)',
+                           [(row_base + row_id, key, value) for row_id, key, value in meta_rows])
+        if field_rows:
+            cursor.executemany(f'''INSERT INTO {self.fields_table} (row_id, {', '.join(map(quote, self.fields))})
+                VALUES ({', '.join('?' * (len(self.fields) + 1))})''',
+                               [(row_base + row[0], *row[1:]) for row in field_rows])
+        return [row_base + row_id for row_id, _, _ in main_rows]
+
+    def _embed(self, texts, embedding_fn=None, batch_embedding_fn=None):
+        if not texts:
+            return []
+        if batch_embedding_fn is None:
+            if embedding_fn is None:
+                raise ValueError("embedding_fn or batch_embedding_fn is required to embed rows without a precomputed embedding")
+            batch_embedding_fn = lambda batch: [embedding_fn(text) for text in batch]
+
+        def embed_batches(texts):
+            embeddings = []
+            for batch in chunks(texts, self.embed_batch_size):
+                embeddings.extend(batch_embedding_fn(batch))
+            return embeddings
+
+        if self.embedding_cache is not None:
+            return self.embedding_cache.embed(texts, embed_batches)
+        return embed_batches(texts)
+
+    def cache_stats(self):
+        """Hit/miss counters of the embedding cache, None when it's disabled."""
+        if self.embedding_cache is None:
+            return None
+        return self.embedding_cache.stats()
+
+    def result_cache_stats(self):
+        """Hit/miss counters of the search result cache, None when it's disabled."""
+        if self.result_cache is None:
+            return None
+        return self.result_cache.stats()
+
+    def migrate_metadata(self):
+        """Move key/value metadata of the declared metadata_fields into their
+        typed columns, e.g. rows written by a pipeline opened without them.
+        Returns the number of key/value rows moved; VACUUM afterwards to give
+        the space back."""
+        with self.write_lock:
+            try:
+                moved = migrate_fields(self.conn.cursor(), self.fields_table, 'row_id', self.meta_table, self.fields)
+            except Exception:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+            self.write_generation += 1
+        return moved
+
+    def data_generation(self):
+        # changes whenever anything was committed to the database
+        if self.in_memory:
+            return (self.write_generation, )
+        with self.version_lock:
+            return (self.write_generation, data_version(self.version_conn))
+
+    def _last_id(self, cursor, table, id_col):
+        # AUTOINCREMENT never hands out an id twice, so continue from whichever
+        # is larger of the current maximum and sqlite_sequence
+        max_id = cursor.execute(f'SELECT MAX({id_col}) FROM {table}').fetchone()[0] or 0
+        seq = cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table, )).fetchone()
+        return max(max_id, seq[0] if seq else 0)
+
+    def _split_chunks(self, content):
+        # group sentences into paragraphs of chunk_size sentences, paragraphs
+        # shorter than DEFAULT_CHUNK_SIZE are carried over into the next one
+        sentences = self.splitter(content)
+        paragraphs = []
+        prev = ''
+        for paragraph in chunks(sentences, self.chunk_size):
+            _content = prev+'\n'.join([sent.strip() for sent in paragraph])
+            if len(_content) <= DEFAULT_CHUNK_SIZE:
+                prev = _content
+                continue
+            paragraphs.append(_content)
+            prev = ''
+        if len(prev) > 0:
+            paragraphs.append(prev)
+        return paragraphs
+
+
+    def search(self, query, embedding=None, top_k=30, fusion=None, weights=None, candidate_k=None, filters=None):
+        """Hybrid fts5 + vss search.
+
+        Without `fusion` the hits of both engines are merged as is and `_score`
+        holds the raw {'fts5': bm25, 'faiss': distance} values. With `fusion`
+        set to one of 'rrf', 'minmax' or 'zscore' every engine returns
+        `candidate_k` (default `top_k`) candidates, the results are sorted by
+        the fused `_score` and truncated to `top_k`; the raw values move to
+        `_raw_score`. `weights` maps 'fts5'/'faiss' to their fusion weight.
+
+        `filters` restricts both engines to rows whose metadata matches, see
+        filters.metadata_filter for the syntax, e.g.
+        {'mime_type': 'application/pdf', 'size_bytes': {'lt': 1 << 20}}.
+
+        Results are served from the result cache while nothing was written
+        since they were computed.
+        """
+        if self.result_cache is None:
+            return self._search(query, embedding, top_k, fusion, weights, candidate_k, filters)
+        key = (normalize_query(query), embedding_key(embedding), top_k,
+               fusion, None if weights is None else tuple(sorted(weights.items())), candidate_k,
+               filter_key(filters))
+        # read before searching, a write landing meanwhile makes the entry
+        # stale right away instead of caching old hits under the new generation
+        generation = self.data_generation()
+        result = self.result_cache.get(key, generation)
+        if result is None:
+            result = self._search(query, embedding, top_k, fusion, weights, candidate_k, filters)
+            self.result_cache.put(key, generation, result)
+        return result
+
+    def _search(self, query, embedding, top_k, fusion, weights, candidate_k, filters=None):
+        limit = top_k if fusion is None else (candidate_k or top_k)
+        row_filter = self._row_filter(filters) if filters else None
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            row_ids = {}
+            for rowid, bm25 in self._fts5_search(cursor, query, limit, row_filter):
+                row_ids[rowid] = {'fts5':  bm25}
+
+            if embedding is not None:
+                for rowid, cosine in self._vss_search(cursor, embedding, limit, row_filter):
+                    if rowid in row_ids:
+                        row_ids[rowid]['faiss'] = cosine
+                    else:
+                        row_ids[rowid] = {'faiss': cosine}
+            if fusion is None:
+                return self._hydrate(cursor, {rowid: {'_score': data} for rowid, data in row_ids.items()})
+            ranked = fuse(row_ids, fusion, weights)[:top_k]
+            return self._hydrate(cursor, {rowid: {'_score': score, '_raw_score': row_ids[rowid]} for rowid, score in ranked})
+
+    def search_prefix(self, partial_query, top_k=10):
+        """fts5-only search for type-ahead, the last term matches as a prefix.
+
+        A last term shorter than the smallest fts_prefix length (default 2
+        bytes) is ignored until more is typed. When more than
+        PREFIX_CANDIDATES rows match, only the first PREFIX_CANDIDATES are
+        ranked by bm25. Results have the shape of `search` without fusion.
+
+        With the result cache enabled, the complete match set of earlier
+        keystrokes bounds the rowids to look at: typing on never adds
+        matches, so a query that extends one without matches returns
+        immediately.
+        """
+        text = normalize_query(partial_query)
+        if text and partial_query[-1].isspace():
+            text += ' '
+        match = fts5_prefix_query(text, self.min_prefix)
+        if not match:
+            return []
+        bounds = None
+        if self.result_cache is not None:
+            generation = self.data_generation()
+            key = ('prefix', match, top_k)
+            result = self.result_cache.get(key, generation)
+            if result is not None:
+                return result
+            bounds = self._prefix_bounds(text, generation)
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            if bounds == ():
+                hits = []
+            elif bounds is not None:
+                cursor.execute(f'''
+                    SELECT rowid, bm25({self.bm25_table}) FROM {self.bm25_table}
+                     WHERE content match ? AND rowid BETWEEN ? AND ?''', (match, bounds[0], bounds[1]))
+                hits = cursor.fetchall()
+            else:
+                cursor.execute(f'''
+                    SELECT rowid, bm25({self.bm25_table}) FROM {self.bm25_table}
+                     WHERE content match ?
+                     LIMIT ?''', (match, PREFIX_CANDIDATES + 1))
+                hits = cursor.fetchall()
+            complete = len(hits) <= PREFIX_CANDIDATES
+            hits = sorted(hits[:PREFIX_CANDIDATES], key=lambda hit: hit[1])
+            result = self._hydrate(cursor, {rowid: {'_score': {'fts5': bm25}} for rowid, bm25 in hits[:top_k]})
+        if self.result_cache is not None:
+            if complete:
+                rowids = [rowid for rowid, _ in hits]
+                self.prefix_matches.put(text, generation, (min(rowids), max(rowids)) if rowids else ())
+            self.result_cache.put(key, generation, result)
+        return result
+
+    def _prefix_bounds(self, text, generation):
+        # (min rowid, max rowid) of the matches of the longest earlier
+        # keystroke whose matches were all fetched, () when it had none
+        for end in range(len(text) - 1, 0, -1):
+            bounds = self.prefix_matches.get(text[:end], generation, count=False)
+            if bounds is not None:
+                return bounds
+        return None
+
+    def _row_filter(self, filters):
+        # (sql, params) selecting the fts5/vss rowids whose row matches filters
+        sql, params = metadata_filter(self.meta_table, filters, self.fields_table, self.fields, self.main_table)
+        if self.chunk_index:
+            sql = f'SELECT chunk_id FROM {self.chunk_table} WHERE row_id IN ({sql})'
+        return sql, params
+
+    def _fts5_search(self, cursor, query, limit, row_filter=None):
+        if self.use_simple_fts5:
+            match = 'simple_query(?)'
+        else:
+            match, query = '?', fts5_query(query)
+            if not query:
+                return []
+        filter_sql, filter_params = '', []
+        if row_filter is not None:
+            # the unary + keeps the IN away from fts5, which would otherwise
+            # run the whole match again for every rowid of the subquery
+            filter_sql = f'AND +rowid IN ({row_filter[0]})'
+            filter_params = row_filter[1]
         cursor.execute(f'''
                 SELECT rowid, bm25({self.bm25_table}) content
                   FROM {self.bm25_table}
-                  WHERE content match simple_query(?)
+                  WHERE content match {match} {filter_sql}
               ORDER BY bm25({self.bm25_table}) 
-                 LIMIT ?''', (query, top_k))
-        res = cursor.fetchall()
-        for rowid, bm25 in res:
-            row_ids[rowid] = {'fts5':  bm25}
-
-        if embedding is not None:
-            sql = f'''SELECT
-                        rowid,
-                        distance
-                    FROM {self.faiss_table}
-                    WHERE vss_search({self.faiss_table}.ctx_embedding, vss_search_params(?, ?))
-                '''
-            res = self.conn.execute(sql, (embedding.tobytes(),top_k)).fetchall()
-            for rowid, cosine in res:
-                if rowid in row_ids:
-                    row_ids[rowid]['faiss'] = cosine
-                else:
-                    row_ids[rowid] = {'faiss': cosine}
+                 LIMIT ?''', (query, *filter_params, limit))
+        return cursor.fetchall()
+
+    def _vss_search(self, cursor, embedding, limit, row_filter=None):
+        sql = f'''SELECT
+                    rowid,
+                    distance
+                FROM {self.faiss_table}
+                WHERE vss_search({self.faiss_table}.ctx_embedding, vss_search_params(?, ?))
+            '''
+        if row_filter is None:
+            return cursor.execute(sql, (embedding.tobytes(), limit)).fetchall()
+        # vss0 can't restrict faiss to a set of rowids, the rowid IN only
+        # drops neighbours afterwards. k starts at what the share of rows
+        # passing the filter suggests and widens until enough pass or every
+        # vector was considered
+        allowed = cursor.execute(f'SELECT COUNT(*) FROM ({row_filter[0]})', row_filter[1]).fetchone()[0]
+        if allowed == 0:
+            return []
+        total = cursor.execute(f'SELECT COUNT(*) FROM {self.chunk_table if self.chunk_index else self.main_table}').fetchone()[0]
+        k = min(total, max(limit * VSS_OVERFETCH, limit * VSS_OVERFETCH * total // allowed))
+        while True:
+            hits = cursor.execute(sql + f'AND rowid IN ({row_filter[0]})',
+                                  (embedding.tobytes(), k, *row_filter[1])).fetchall()
+            if len(hits) >= limit or k >= total:
+                break
+            k = min(total, k * VSS_OVERFETCH)
+        return sorted(hits, key=lambda hit: hit[1])[:limit]
+
+    def _hydrate(self, cursor, row_ids):
+        # row_ids maps each hit to the score fields of its result, paragraphs,
+        # metadata and links are fetched with one set based query per table
+        # instead of a round trip per hit
+        paragraphs = {}
+        if self.chunk_index:
+            for chunk_id, rowid, paragraph in self._select_in(cursor,
+                    f'SELECT chunk_id, row_id, paragraph FROM {self.chunk_table} WHERE chunk_id IN ({{}})',
+                    list(row_ids)):
+                paragraphs[chunk_id] = (rowid, paragraph)
+            parent_ids = list({rowid for rowid, _ in paragraphs.values()})
+        else:
+            parent_ids = list(row_ids)
+        metadatas = {}
+        for rowid, key, value in self._select_in(cursor,
+                f'SELECT row_id, meta_key, meta_value FROM {self.meta_table} WHERE row_id IN ({{}})',
+                parent_ids):
+            metadatas.setdefault(rowid, []).append((key, value))
+        if self.fields:
+            names = list(self.fields)
+            for rowid, *values in self._select_in(cursor,
+                    f'SELECT row_id, {", ".join(map(quote, names))} FROM {self.fields_table} WHERE row_id IN ({{}})',
+                    parent_ids):
+                metadatas.setdefault(rowid, []).extend(
+                    (name, value) for name, value in zip(names, values) if value is not None)
+        links = dict(self._select_in(cursor,
+                f'SELECT row_id, link FROM {self.main_table} WHERE row_id IN ({{}})',
+                parent_ids))
+
         result = []
         for rowid, data in row_ids.items():
             metadata = {}
             if self.chunk_index:
-                cursor.execute(f'SELECT row_id, paragraph FROM {self.chunk_table} WHERE chunk_id = ?', (rowid, ))
-                rowid, paragraph = cursor.fetchone()
+                if rowid not in paragraphs:
+                    continue
+                rowid, paragraph = paragraphs[rowid]
                 metadata['paragraph'] = paragraph
-            cursor.execute(f'SELECT meta_key, meta_value FROM {self.meta_table} WHERE row_id = ?', (rowid, ))
-            metadatas = cursor.fetchall()
-            for key, value in metadatas:
+            if rowid not in links:
+                continue
+            for key, value in metadatas.get(rowid, []):
                 metadata[key] = value
             metadata['rowid'] = rowid
-            metadata['_score'] = data
-            res = cursor.execute(f'SELECT link from {self.main_table} where row_id = ?', (rowid, )).fetchone()
-            metadata['link'] = res[0]
+            metadata.update(data)
+            metadata['link'] = links[rowid]
             result.append(metadata)
         return result
 
+    def _select_in(self, cursor, sql, ids):
+        # run `sql` with its IN (...) placeholder expanded over ids, in slices
+        # that stay below SQLite's bound parameter limit
+        for batch in chunks(ids, SQLITE_MAX_VARIABLES):
+            cursor.execute(sql.format(', '.join('?' * len(batch))), batch)
+            yield from cursor.fetchall()
+
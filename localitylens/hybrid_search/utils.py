@@ -1,3 +1,4 @@
+import itertools
 
 
 def chunks(lst, N):
@@ -5,3 +6,34 @@ def chunks(lst, N):
         yield lst[idx:idx+N]
 
 
+def batched(iterable, N):
+    it = iter(iterable)
+    while True:
+        batch = list(itertools.islice(it, N))
+        if not batch:
+            return
+        yield batch
+
+
+def fts5_term(term):
+    return '"{}"'.format(term.replace('"', '""'))
+
+
+def fts5_query(text):
+    # quote every whitespace separated term so user input can't break the
+    # FTS5 query syntax, terms are implicitly AND-ed
+    return ' '.join(fts5_term(term) for term in text.split())
+
+
+def fts5_prefix_query(text, min_prefix=1):
+    # like fts5_query, but the last term matches as a prefix unless whitespace
+    # follows it. A last term shorter than min_prefix bytes is left out, a
+    # prefix below the shortest prefix index means scanning the whole vocabulary
+    terms = text.split()
+    if not terms or text[-1].isspace():
+        return ' '.join(fts5_term(term) for term in terms)
+    last = terms.pop()
+    query = [fts5_term(term) for term in terms]
+    if len(last.encode('utf-8')) >= min_prefix:
+        query.append(fts5_term(last) + '*')
+    return ' '.join(query)
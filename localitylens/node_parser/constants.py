@@ -8,6 +8,7 @@ DEFAULT_NUM_OUTPUTS = 256  # tokens
 DEFAULT_NUM_INPUT_FILES = 10  # files
 
 DEFAULT_EMBED_BATCH_SIZE = 10
+DEFAULT_INSERT_BATCH_SIZE = 1000  # rows per transaction
 
 DEFAULT_CHUNK_SIZE = 1024  # tokens
 DEFAULT_CHUNK_OVERLAP = 20  # tokens
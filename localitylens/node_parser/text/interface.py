@@ -1,6 +1,7 @@
 """Node parser interface."""
 from abc import ABC, abstractmethod
-from typing import Any, List, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
 
 from pydantic import Field
 from localitylens.node_parser.node_utils import (
@@ -17,6 +18,21 @@ from localitylens.node_parser.text.schema import (
 )
 from localitylens.node_parser.utils import get_tqdm_iterable
 
+# shards per worker process, so a shard of large documents doesn't hold up
+# the whole pool
+SHARDS_PER_WORKER = 4
+
+_worker_parser = None
+
+
+def _init_worker(parser: "NodeParser") -> None:
+    global _worker_parser
+    _worker_parser = parser
+
+
+def _parse_shard(documents: Sequence[Document], kwargs: Dict[str, Any]) -> List[BaseNode]:
+    return _worker_parser._parse_documents(documents, **kwargs)
+
 
 class NodeParser(TransformComponent, ABC):
     """Base interface for node parser."""
@@ -48,6 +64,7 @@ class NodeParser(TransformComponent, ABC):
         self,
         documents: Sequence[Document],
         show_progress: bool = False,
+        num_workers: Optional[int] = None,
         **kwargs: Any,
     ) -> List[BaseNode]:
         """Parse documents into nodes.
@@ -55,13 +72,84 @@ class NodeParser(TransformComponent, ABC):
         Args:
             documents (Sequence[Document]): documents to parse
             show_progress (bool): whether to show progress bar
+            num_workers (Optional[int]): parse in this many worker processes.
+                Documents are cut into contiguous shards, nodes are returned
+                in document order and prev/next relationships are wired
+                across shards as if parsed in one go. The parser is handed
+                to each worker when it starts, with the fork start method
+                (the Linux default) it needn't be picklable.
+
+        """
+        if num_workers is not None and num_workers > 1 and len(documents) > 1:
+            nodes = self._parse_documents_parallel(
+                documents, num_workers, show_progress=show_progress, **kwargs
+            )
+        else:
+            nodes = self._parse_documents(
+                documents, show_progress=show_progress, **kwargs
+            )
+
+        if self.include_prev_next_rel:
+            for i, node in enumerate(nodes):
+                if i > 0:
+                    node.relationships[NodeRelationship.PREVIOUS] = nodes[
+                        i - 1
+                    ].as_related_node_info()
+                if i < len(nodes) - 1:
+                    node.relationships[NodeRelationship.NEXT] = nodes[
+                        i + 1
+                    ].as_related_node_info()
+
+        return nodes
+
+    def iter_nodes_from_documents(
+        self,
+        documents: Iterable[Document],
+        show_progress: bool = False,
+        **kwargs: Any,
+    ) -> Iterator[BaseNode]:
+        """Parse documents into nodes lazily, one document at a time.
+
+        Yields the nodes get_nodes_from_documents would return, in the same
+        order and with the same prev/next relationships, while holding only
+        the nodes of the current document plus the last one (held back until
+        its next node is known). documents can be a generator, so a corpus
+        larger than memory can be piped into Pipeline.insert_many.
+
+        Args:
+            documents (Iterable[Document]): documents to parse
+            show_progress (bool): whether to show progress bar
 
         """
+        prev_node: Optional[BaseNode] = None
+        documents = get_tqdm_iterable(documents, show_progress, "Parsing nodes")
+        for document in documents:
+            for node in self._parse_documents([document], **kwargs):
+                if prev_node is not None:
+                    if self.include_prev_next_rel:
+                        prev_node.relationships[
+                            NodeRelationship.NEXT
+                        ] = node.as_related_node_info()
+                        node.relationships[
+                            NodeRelationship.PREVIOUS
+                        ] = prev_node.as_related_node_info()
+                    yield prev_node
+                prev_node = node
+        if prev_node is not None:
+            yield prev_node
+
+    def _parse_documents(
+        self,
+        documents: Sequence[Document],
+        show_progress: bool = False,
+        **kwargs: Any,
+    ) -> List[BaseNode]:
+        """Parse documents into nodes, with char offsets and document metadata set."""
         doc_id_to_document = {doc.id_: doc for doc in documents}
 
         nodes = self._parse_nodes(documents, show_progress=show_progress, **kwargs)
 
-        for i, node in enumerate(nodes):
+        for node in nodes:
             if (
                 node.ref_doc_id is not None
                 and node.ref_doc_id in doc_id_to_document
@@ -84,16 +172,29 @@ class NodeParser(TransformComponent, ABC):
                         doc_id_to_document[node.ref_doc_id].metadata
                     )
 
-            if self.include_prev_next_rel:
-                if i > 0:
-                    node.relationships[NodeRelationship.PREVIOUS] = nodes[
-                        i - 1
-                    ].as_related_node_info()
-                if i < len(nodes) - 1:
-                    node.relationships[NodeRelationship.NEXT] = nodes[
-                        i + 1
-                    ].as_related_node_info()
+        return nodes
 
+    def _parse_documents_parallel(
+        self,
+        documents: Sequence[Document],
+        num_workers: int,
+        show_progress: bool = False,
+        **kwargs: Any,
+    ) -> List[BaseNode]:
+        """_parse_documents over contiguous shards in a process pool."""
+        documents = list(documents)
+        num_shards = min(len(documents), num_workers * SHARDS_PER_WORKER)
+        bounds = [len(documents) * i // num_shards for i in range(num_shards + 1)]
+        nodes: List[BaseNode] = []
+        with ProcessPoolExecutor(
+            num_workers, initializer=_init_worker, initargs=(self,)
+        ) as pool:
+            futures = [
+                pool.submit(_parse_shard, documents[start:end], kwargs)
+                for start, end in zip(bounds, bounds[1:])
+            ]
+            for future in get_tqdm_iterable(futures, show_progress, "Parsing nodes"):
+                nodes.extend(future.result())
         return nodes
 
     def __call__(self, nodes: List[BaseNode] | BaseNode, **kwargs: Any) -> List[BaseNode]:
@@ -1,13 +1,21 @@
 """Token splitter."""
 import logging
-from typing import Callable, List, Optional
+from collections import deque
+from itertools import accumulate
+from typing import Callable, Deque, List, Optional, Tuple
+
+import numpy as np
 from pydantic import Field, PrivateAttr
 from localitylens.node_parser.constants import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_SIZE
 from localitylens.node_parser.text.interface import MetadataAwareTextSplitter
 from localitylens.node_parser.node_utils import default_id_func
 from localitylens.node_parser.text.utils import split_by_char, split_by_sep
 from localitylens.node_parser.text.schema import Document
-from localitylens.node_parser.utils import get_tokenizer
+from localitylens.node_parser.utils import (
+    get_token_length,
+    get_token_offsets_fn,
+    get_tokenizer,
+)
 
 _logger = logging.getLogger(__name__)
 
@@ -36,6 +44,7 @@ class TokenTextSplitter(MetadataAwareTextSplitter):
     )
 
     _tokenizer: Callable = PrivateAttr()
+    _token_offsets: Optional[Callable] = PrivateAttr()
     _split_fns: List[Callable] = PrivateAttr()
 
     def __init__(
@@ -57,6 +66,7 @@ class TokenTextSplitter(MetadataAwareTextSplitter):
             )
         id_func = id_func or default_id_func
         self._tokenizer = tokenizer or get_tokenizer()
+        self._token_offsets = get_token_offsets_fn(self._tokenizer)
 
         all_seps = [separator] + (backup_separators or [])
         self._split_fns = [split_by_sep(sep) for sep in all_seps] + [split_by_char()]
@@ -99,7 +109,10 @@ class TokenTextSplitter(MetadataAwareTextSplitter):
 
     def split_text_metadata_aware(self, text: str, metadata_str: str) -> List[str]:
         """Split text into chunks, reserving space required for metadata str."""
-        metadata_len = len(self._tokenizer(metadata_str)) + DEFAULT_METADATA_FORMAT_LEN
+        # the nodes of a document share their metadata str
+        metadata_len = (
+            get_token_length(metadata_str, self._tokenizer) + DEFAULT_METADATA_FORMAT_LEN
+        )
         effective_chunk_size = self.chunk_size - metadata_len
         if effective_chunk_size <= 0:
             raise ValueError(
@@ -127,12 +140,37 @@ class TokenTextSplitter(MetadataAwareTextSplitter):
         if text == "":
             return [text]
 
-        splits = self._split(text, chunk_size)
+        count = self._token_counter(text)
+        splits = self._split(text, chunk_size, count)
         chunks = self._merge(splits, chunk_size)
 
         return chunks
 
-    def _split(self, text: str, chunk_size: int) -> List[str]:
+    def _token_counter(self, text: str) -> Callable[[List[int]], List[int]]:
+        """Get a function mapping character boundaries [b0, b1, ..., bn] of text
+        to the token counts of text[b0:b1], ..., text[bn-1:bn].
+
+        With a tiktoken tokenizer the text is encoded once and a span counts
+        the tokens starting inside it, otherwise every span is tokenized,
+        through the token length cache as the same words recur.
+        """
+        if self._token_offsets is None:
+            return lambda bounds: [
+                get_token_length(text[start:end], self._tokenizer)
+                for start, end in zip(bounds, bounds[1:])
+            ]
+
+        offsets = self._token_offsets(text)
+        return lambda bounds: np.diff(np.searchsorted(offsets, bounds)).tolist()
+
+    def _split(
+        self,
+        text: str,
+        chunk_size: int,
+        count: Callable[[List[int]], List[int]],
+        start: int = 0,
+        text_len: Optional[int] = None,
+    ) -> List[Tuple[str, int]]:
         """Break text into splits that are smaller than chunk size.
 
         The order of splitting is:
@@ -140,27 +178,34 @@ class TokenTextSplitter(MetadataAwareTextSplitter):
         2. split by backup separators (if any)
         3. split by characters
 
+        text starts at character `start` of the text `count` measures.
+        Returns (split, token length) pairs.
+
         NOTE: the splits contain the separators.
         """
-        if len(self._tokenizer(text)) <= chunk_size:
-            return [text]
+        if text_len is None:
+            text_len = count([start, start + len(text)])[0]
+        if text_len <= chunk_size:
+            return [(text, text_len)]
 
         for split_fn in self._split_fns:
             splits = split_fn(text)
             if len(splits) > 1:
                 break
 
+        bounds = list(accumulate((len(split) for split in splits), initial=start))
         new_splits = []
-        for split in splits:
-            split_len = len(self._tokenizer(split))
+        for split, split_start, split_len in zip(splits, bounds, count(bounds)):
             if split_len <= chunk_size:
-                new_splits.append(split)
+                new_splits.append((split, split_len))
             else:
                 # recursively split
-                new_splits.extend(self._split(split, chunk_size=chunk_size))
+                new_splits.extend(
+                    self._split(split, chunk_size, count, split_start, split_len)
+                )
         return new_splits
 
-    def _merge(self, splits: List[str], chunk_size: int) -> List[str]:
+    def _merge(self, splits: List[Tuple[str, int]], chunk_size: int) -> List[str]:
         """Merge splits into chunks.
 
         The high-level idea is to keep adding splits to a chunk until we
@@ -168,24 +213,29 @@ class TokenTextSplitter(MetadataAwareTextSplitter):
 
         When we start a new chunk, we pop off the first element of the previous
         chunk until the total length is less than the chunk size.
+
+        The current chunk is kept as deques of split texts and their token
+        lengths, so popping the overlap off is O(1) per split and text is only
+        joined when a chunk is emitted.
         """
         chunks: List[str] = []
 
-        cur_chunk: List[str] = []
+        cur_texts: Deque[str] = deque()
+        cur_lens: Deque[int] = deque()
         cur_len = 0
-        for split in splits:
-            split_len = len(self._tokenizer(split))
+        for split, split_len in splits:
             if split_len > chunk_size:
                 _logger.warning(
-                    f"Got a split of size {split_len}, ",
-                    f"larger than chunk size {chunk_size}.",
+                    "Got a split of size %d, larger than chunk size %d.",
+                    split_len,
+                    chunk_size,
                 )
 
             # if we exceed the chunk size after adding the new split, then
             # we need to end the current chunk and start a new one
             if cur_len + split_len > chunk_size:
                 # end the previous chunk
-                chunk = "".join(cur_chunk).strip()
+                chunk = "".join(cur_texts).strip()
                 if chunk:
                     chunks.append(chunk)
 
@@ -193,17 +243,21 @@ class TokenTextSplitter(MetadataAwareTextSplitter):
                 # keep popping off the first element of the previous chunk until:
                 #   1. the current chunk length is less than chunk overlap
                 #   2. the total length is less than chunk size
-                while cur_len > self.chunk_overlap or cur_len + split_len > chunk_size:
+                # an oversized split empties the chunk and ends up alone in the next one
+                while cur_lens and (
+                    cur_len > self.chunk_overlap or cur_len + split_len > chunk_size
+                ):
                     # pop off the first element
-                    first_chunk = cur_chunk.pop(0)
-                    cur_len -= len(self._tokenizer(first_chunk))
+                    cur_texts.popleft()
+                    cur_len -= cur_lens.popleft()
 
-            cur_chunk.append(split)
+            cur_texts.append(split)
+            cur_lens.append(split_len)
             cur_len += split_len
 
         # handle the last chunk
-        chunk = "".join(cur_chunk).strip()
+        chunk = "".join(cur_texts).strip()
         if chunk:
             chunks.append(chunk)
 
-        return chunks
\ No newline at end of file
+        return chunks
@@ -2,12 +2,14 @@ import asyncio
 import os
 import random
 import sys
+import threading
 import time
 import traceback
 import uuid
+from collections import OrderedDict
 from contextlib import contextmanager
 from dataclasses import dataclass
-from functools import partial, wraps
+from functools import lru_cache, partial, wraps
 from itertools import islice
 from pathlib import Path
 from typing import (
@@ -95,16 +97,16 @@ class Tokenizer(Protocol):
 
 
 def set_global_tokenizer(tokenizer: Union[Tokenizer, Callable[[str], list]]) -> None:
-    import llama_index.core
+    import localitylens.node_parser as node_parser
 
     if isinstance(tokenizer, Tokenizer):
-        llama_index.core.global_tokenizer = tokenizer.encode
+        node_parser.global_tokenizer = tokenizer.encode
     else:
-        llama_index.core.global_tokenizer = tokenizer
+        node_parser.global_tokenizer = tokenizer
 
 
 def get_tokenizer() -> Callable[[str], List]:
-    import node_parser
+    import localitylens.node_parser as node_parser
 
     if node_parser.global_tokenizer is None:
         tiktoken_import_err = (
@@ -135,6 +137,129 @@ def get_tokenizer() -> Callable[[str], List]:
     return node_parser.global_tokenizer
 
 
+@lru_cache(maxsize=8)
+def _token_byte_lengths(encoding: Any) -> Any:
+    """Byte length of every token id of a tiktoken encoding, 0 for unused ids."""
+    import numpy as np
+
+    lengths = np.zeros(encoding.n_vocab, dtype=np.int64)
+    for token in range(encoding.n_vocab):
+        try:
+            lengths[token] = len(encoding.decode_single_token_bytes(token))
+        except KeyError:
+            pass
+    return lengths
+
+
+DEFAULT_TOKEN_LENGTH_CACHE_SIZE = 65536
+
+
+class TokenLengthCache:
+    """Bounded, thread-safe LRU cache of token counts.
+
+    Entries are keyed by the tokenizer and the hash and length of the text,
+    so texts themselves are not kept alive. Besides hit/miss counters it
+    records the time spent in the tokenizer on misses and, per entry, how
+    long computing it took, which adds up to the tokenizer time hits saved.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_TOKEN_LENGTH_CACHE_SIZE) -> None:
+        self.maxsize = maxsize
+        self._lengths: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.tokenizer_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def length(self, tokenizer: Callable[[str], List], text: str) -> int:
+        """Number of tokens of text under tokenizer."""
+        key = (tokenizer, hash(text), len(text))
+        with self._lock:
+            entry = self._lengths.get(key)
+            if entry is not None:
+                self._lengths.move_to_end(key)
+                self.hits += 1
+                self.saved_seconds += entry[1]
+                return entry[0]
+        # tokenize outside the lock, two threads may both compute a missing entry
+        start = time.perf_counter()
+        length = len(tokenizer(text))
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.misses += 1
+            self.tokenizer_seconds += elapsed
+            if self.maxsize > 0:
+                self._lengths[key] = (length, elapsed)
+                self._lengths.move_to_end(key)
+                while len(self._lengths) > self.maxsize:
+                    self._lengths.popitem(last=False)
+        return length
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lengths.clear()
+            self.hits = 0
+            self.misses = 0
+            self.tokenizer_seconds = 0.0
+            self.saved_seconds = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._lengths),
+                "tokenizer_seconds": self.tokenizer_seconds,
+                "saved_seconds": self.saved_seconds,
+            }
+
+
+# shared by the splitters and count_tokens
+token_length_cache = TokenLengthCache()
+
+
+def get_token_length(
+    text: str, tokenizer: Optional[Callable[[str], List]] = None
+) -> int:
+    """Number of tokens of text, through token_length_cache."""
+    return token_length_cache.length(tokenizer or get_tokenizer(), text)
+
+
+def get_token_offsets_fn(tokenizer: Callable[[str], List]) -> Optional[Callable]:
+    """Get a function returning the start character offset of every token of a text.
+
+    Only tiktoken tokenizers (an Encoding's encode method, or a partial of it
+    like the one get_tokenizer returns) are supported, None is returned for
+    any other tokenizer. Offsets follow Encoding.decode_with_offsets, a token
+    starting inside a multi-byte character starts at that character, but
+    are computed with numpy instead of a Python loop over the tokens.
+    """
+    encode = getattr(tokenizer, "func", tokenizer)
+    encoding = getattr(encode, "__self__", None)
+    if not hasattr(encoding, "decode_single_token_bytes"):
+        return None
+
+    import numpy as np
+
+    def offsets(text: str) -> np.ndarray:
+        lengths = _token_byte_lengths(encoding)[
+            np.asarray(tokenizer(text), dtype=np.int64)
+        ]
+        byte_starts = np.cumsum(lengths) - lengths
+        if text.isascii():
+            return byte_starts
+        data = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+        continuation = (data & 0xC0) == 0x80
+        # characters started before each byte
+        char_starts = np.concatenate(([0], np.cumsum(~continuation)))
+        return char_starts[byte_starts] - continuation[byte_starts]
+
+    return offsets
+
+
 def get_new_id(d: Set) -> str:
     """Get a new ID."""
     while True:
@@ -282,9 +407,7 @@ def get_tqdm_iterable(items: Iterable, show_progress: bool, desc: str) -> Iterab
 
 
 def count_tokens(text: str) -> int:
-    tokenizer = get_tokenizer()
-    tokens = tokenizer(text)
-    return len(tokens)
+    return get_token_length(text)
 
 
 def get_transformer_tokenizer_fn(model_name: str) -> Callable[[str], List[str]]:
@@ -0,0 +1,70 @@
+import time
+import asyncio
+from localitylens.hybrid_search.async_pipeline import AsyncPipeline
+
+
+class SlowPipeline():
+    # stands in for Pipeline, search takes long enough for callers to pile up
+    read_pool = None
+
+    def __init__(self):
+        self.calls = 0
+
+    def search(self, query, embedding=None, **kwargs):
+        self.calls += 1
+        time.sleep(0.1)
+        return [{'rowid': 1, 'link': query, '_score': {'fts5': -1.0}}]
+
+
+def test_coalesced_waiters_get_their_own_results():
+    pipeline = SlowPipeline()
+    async_pipeline = AsyncPipeline(pipeline)
+
+    async def main():
+        return await asyncio.gather(async_pipeline.search('hello'), async_pipeline.search('hello'))
+
+    try:
+        first, second = asyncio.run(main())
+    finally:
+        async_pipeline.close()
+    assert pipeline.calls == 1
+    first[0]['_score']['fts5'] = 0.0
+    first.append({'rowid': 2})
+    assert second == [{'rowid': 1, 'link': 'hello', '_score': {'fts5': -1.0}}]
+
+
+def test_repeated_search_on_a_channel_joins_the_one_in_progress():
+    pipeline = SlowPipeline()
+    async_pipeline = AsyncPipeline(pipeline)
+
+    async def main():
+        first = asyncio.ensure_future(async_pipeline.search('abc', channel='box'))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(async_pipeline.search('abc', channel='box'))
+        return await asyncio.gather(first, second)
+
+    try:
+        first, second = asyncio.run(main())
+    finally:
+        async_pipeline.close()
+    assert pipeline.calls == 1
+    assert first == second == [{'rowid': 1, 'link': 'abc', '_score': {'fts5': -1.0}}]
+    assert first is not second
+
+
+def test_new_search_on_a_channel_cancels_the_previous_one():
+    pipeline = SlowPipeline()
+    async_pipeline = AsyncPipeline(pipeline)
+
+    async def main():
+        first = asyncio.ensure_future(async_pipeline.search('ab', channel='box'))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(async_pipeline.search('abc', channel='box'))
+        return await asyncio.gather(first, second, return_exceptions=True)
+
+    try:
+        first, second = asyncio.run(main())
+    finally:
+        async_pipeline.close()
+    assert isinstance(first, asyncio.CancelledError)
+    assert second == [{'rowid': 1, 'link': 'abc', '_score': {'fts5': -1.0}}]
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from localitylens import Pipeline
+from localitylens.node_parser.text import utils as text_utils
+
+DIM = 4
+
+
+def embedding(seed):
+    return np.random.RandomState(seed).rand(DIM).astype(np.float32)
+
+
+def embed(text):
+    # chunks are embedded one by one in chunk mode
+    return embedding(len(text))
+
+
+def ids(pipeline, sql, *params):
+    return sorted(row[0] for row in pipeline.conn.execute(sql, params))
+
+
+def check_consistent(pipeline):
+    row_ids = ids(pipeline, 'SELECT row_id FROM docs')
+    if pipeline.chunk_index:
+        vss_ids = ids(pipeline, 'SELECT chunk_id FROM docs_chunk')
+        assert ids(pipeline, 'SELECT DISTINCT row_id FROM docs_chunk') == row_ids
+    else:
+        vss_ids = row_ids
+    assert ids(pipeline, 'SELECT rowid FROM docs_faiss') == vss_ids
+    assert ids(pipeline, 'SELECT rowid FROM docs_fts5 WHERE docs_fts5 MATCH ?', 'shared') == vss_ids
+    assert set(ids(pipeline, 'SELECT row_id FROM docs_metadata')) <= set(row_ids)
+    assert ids(pipeline, 'SELECT row_id FROM docs_fields') == row_ids
+
+
+@pytest.fixture(params=[False, True], ids=['rows', 'chunks'])
+def pipeline(request, tmp_path, monkeypatch):
+    # one chunk per sentence, without the nltk tokenizer
+    monkeypatch.setattr(text_utils, 'split_by_sentence_tokenizer', lambda: lambda text: text.split('. '))
+    pipeline = Pipeline(str(tmp_path / 'docs.db'), 'docs', DIM, chunk_index=request.param, chunk_size=1,
+                        metadata_fields={'size': int})
+    yield pipeline
+    pipeline.close()
+
+
+def test_delete_and_upsert_keep_tables_in_sync(pipeline):
+    # long enough sentences to end up in separate chunks
+    sentence = 'shared {} sentence ' + 'padding ' * 150
+    rows = [{'content': '. '.join(sentence.format(f'{link}{i}') for i in range(2)), 'link': link,
+             'size': size, 'mime_type': 'text/plain'}
+            for size, link in enumerate('abc')]
+    pipeline.insert_many(rows, [embedding(i) for i in range(3)], 'content', 'link', embed)
+    check_consistent(pipeline)
+
+    pipeline.upsert_many([{'content': sentence.format('fresh'), 'link': 'b', 'size': 7}], [embedding(3)],
+                         'content', 'link', embed)
+    check_consistent(pipeline)
+    assert ids(pipeline, 'SELECT rowid FROM docs_fts5 WHERE docs_fts5 MATCH ?', 'b0') == []
+    assert len(ids(pipeline, 'SELECT rowid FROM docs_fts5 WHERE docs_fts5 MATCH ?', 'fresh')) == 1
+    assert pipeline.conn.execute("SELECT size FROM docs_fields JOIN docs USING (row_id) WHERE link = 'b'").fetchall() \
+        == [(7, )]
+
+    assert pipeline.delete_many(['a', 'missing']) == 1
+    check_consistent(pipeline)
+    assert ids(pipeline, 'SELECT rowid FROM docs_fts5 WHERE docs_fts5 MATCH ?', 'a0') == []
+    assert {row['link'] for row in pipeline.search('shared', embedding(0))} == {'b', 'c'}
+
+    assert pipeline.delete_many(['b', 'c']) == 2
+    check_consistent(pipeline)
+    assert ids(pipeline, 'SELECT row_id FROM docs_metadata') == []
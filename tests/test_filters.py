@@ -0,0 +1,67 @@
+import sqlite3
+import pytest
+from localitylens.hybrid_search.filters import metadata_filter
+
+ITEMS = {
+    1: {'mime_type': 'text/plain', 'pages': '9', 'group': 'a', 'size': 10},
+    2: {'mime_type': 'application/pdf', 'pages': '10', 'group': 'b', 'size': 2048},
+    3: {'mime_type': 'application/pdf', 'group': 'a'},
+    4: {},
+}
+FIELDS = ('group', 'size')
+
+
+@pytest.fixture(scope='module')
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE main (row_id INTEGER PRIMARY KEY)')
+    conn.execute('CREATE TABLE meta (row_id INTEGER, meta_key TEXT, meta_value TEXT)')
+    conn.execute('CREATE TABLE fields (row_id INTEGER PRIMARY KEY, "group" TEXT, size INTEGER)')
+    for row_id, metadata in ITEMS.items():
+        conn.execute('INSERT INTO main VALUES (?)', (row_id,))
+        typed = {key: value for key, value in metadata.items() if key in FIELDS}
+        if typed:
+            conn.execute('INSERT INTO fields VALUES (?, ?, ?)', (row_id, typed.get('group'), typed.get('size')))
+        conn.executemany('INSERT INTO meta VALUES (?, ?, ?)',
+                         [(row_id, key, value) for key, value in metadata.items() if key not in FIELDS])
+    yield conn
+    conn.close()
+
+
+def matching(conn, filters):
+    sql, params = metadata_filter('meta', filters, 'fields', FIELDS, 'main')
+    return sorted(row_id for row_id, in conn.execute(sql, params))
+
+
+@pytest.mark.parametrize('filters, expected', [
+    ({'mime_type': 'application/pdf'}, [2, 3]),
+    ({'mime_type': {'ne': 'application/pdf'}}, [1]),
+    ({'mime_type': {'in': ['text/plain', 'image/png']}}, [1]),
+    ({'mime_type': {'in': []}}, []),
+    # numbers compare numerically, not as text
+    ({'pages': {'gt': 9}}, [2]),
+    ({'pages': {'gte': 9, 'lt': 10}}, [1]),
+    ({'pages': {'in': [10, 11]}}, [2]),
+    ({'pages': {'eq': None}}, []),
+    ({'pages': {'ne': None}}, [1, 2]),
+    # typed fields
+    ({'group': 'a'}, [1, 3]),
+    ({'size': {'gte': 1024}}, [2]),
+    ({'group': 'a', 'size': {'lt': 100}}, [1]),
+    ({'size': {'eq': None}}, [3, 4]),
+    # typed and key/value conditions intersect
+    ({'group': 'a', 'mime_type': 'application/pdf'}, [3]),
+    ({'size': {'eq': None}, 'mime_type': {'ne': 'text/plain'}}, [3]),
+])
+def test_metadata_filter(conn, filters, expected):
+    assert matching(conn, filters) == expected
+
+
+def test_unknown_operator():
+    with pytest.raises(ValueError):
+        metadata_filter('meta', {'pages': {'between': 1}})
+
+
+def test_missing_typed_field_needs_main_table():
+    with pytest.raises(ValueError):
+        metadata_filter('meta', {'size': {'eq': None}}, 'fields', FIELDS)
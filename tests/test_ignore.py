@@ -0,0 +1,63 @@
+import fnmatch
+import pytest
+from localitylens.dir_walker.ignore import IgnoreMatcher, parse_ignore_file
+
+
+def ignored(text, relative, is_dir=False):
+    rules = (('/r', parse_ignore_file(text)),)
+    return IgnoreMatcher([]).ignored('/r/' + relative, is_dir, rules)
+
+
+@pytest.mark.parametrize('text, relative, is_dir, expected', [
+    # negation, the last matching rule wins
+    ('*.log\n!keep.log', 'x.log', False, True),
+    ('*.log\n!keep.log', 'sub/keep.log', False, False),
+    ('!keep.log\n*.log', 'keep.log', False, True),
+    ('\\!bang', '!bang', False, True),
+    # '**'
+    ('**/build', 'build', True, True),
+    ('**/build', 'a/b/build', True, True),
+    ('a/**/b', 'a/b', False, True),
+    ('a/**/b', 'a/x/y/b', False, True),
+    ('a/**', 'a/x/y', False, True),
+    ('a/**', 'b/a/x', False, False),
+    # anchoring: a slash before the end ties the pattern to its directory
+    ('/top', 'top', False, True),
+    ('/top', 'sub/top', False, False),
+    ('doc/*.txt', 'doc/x.txt', False, True),
+    ('doc/*.txt', 'doc/sub/x.txt', False, False),
+    ('doc/*.txt', 'y/doc/x.txt', False, False),
+    ('name', 'deep/down/name', False, True),
+    # directory only
+    ('out/', 'out', True, True),
+    ('out/', 'out', False, False),
+    # bracket classes
+    ('[a-c]x', 'bx', False, True),
+    ('[a-c]x', 'dx', False, False),
+    ('[!a]bc', 'abc', False, False),
+    ('[!a]bc', 'xbc', False, True),
+    ('[/', '[', False, False),
+    # trailing spaces are dropped unless escaped
+    ('bar   ', 'bar', False, True),
+    ('foo\\ ', 'foo ', False, True),
+    ('foo\\ ', 'foo', False, False),
+    # comments and blank lines
+    ('# x\n\n#y', '# x', False, False),
+    ('\\#hash', '#hash', False, True),
+])
+def test_gitignore_rules(text, relative, is_dir, expected):
+    assert ignored(text, relative, is_dir) is expected
+
+
+PATTERNS = ['*/node_modules/*', '*/.git', '*.pyc', '/tmp/x*', '*/a?c', '*/[bc]uild/*']
+PATHS = [
+    '/home/u/node_modules/x.js', '/node_modules/x.js', '/home/node_modules', '/home/u/node_modules',
+    '/repo/.git', '/repo/.git/config', '/repo/.gitignore', '/x/y.pyc', '/x/y.py',
+    '/tmp/xyz', '/tmp/a/xyz', '/d/abc', '/d/abcd', '/d/build/o', '/d/guild/o', '/d/build',
+]
+
+
+@pytest.mark.parametrize('path', PATHS)
+def test_match_is_fnmatch(path):
+    matcher = IgnoreMatcher(PATTERNS)
+    assert matcher.match(path) == any(fnmatch.fnmatch(path, pattern) for pattern in PATTERNS)
@@ -0,0 +1,38 @@
+import numpy as np
+from localitylens import Pipeline
+from localitylens.dir_walker.storage import FileStore
+
+DIM = 4
+
+
+def embedding(seed):
+    return np.random.RandomState(seed).rand(DIM).astype(np.float32)
+
+
+def test_pipeline_fields_named_after_sql_keywords(tmp_path):
+    # group and order are keywords, detection writes group itself
+    fields = {'group': str, 'order': int}
+    pipeline = Pipeline(str(tmp_path / 'docs.db'), 'docs', DIM, metadata_fields=fields)
+    pipeline.insert({'content': 'hello one', 'link': 'a', 'group': 'text', 'order': 1}, embedding(0), 'content', 'link')
+    pipeline.insert_many([{'content': 'hello two', 'link': 'b', 'group': 'code', 'order': 2}], [embedding(1)],
+                         'content', 'link')
+    results = pipeline.search('hello', filters={'group': 'code', 'order': {'gte': 2}})
+    assert [(row['link'], row['group'], row['order']) for row in results] == [('b', 'code', 2)]
+    pipeline.insert({'content': 'hello three', 'link': 'c', 'select': 'x'}, embedding(2), 'content', 'link')
+    pipeline.close()
+
+    # the key/value rows of a newly declared field move to its column on open
+    pipeline = Pipeline(str(tmp_path / 'docs.db'), 'docs', DIM, metadata_fields=dict(fields, select=str))
+    assert [row['link'] for row in pipeline.search('hello', filters={'select': 'x'})] == ['c']
+    assert pipeline.conn.execute('SELECT COUNT(*) FROM docs_metadata').fetchone() == (0, )
+    pipeline.close()
+
+
+def test_file_store_fields_named_after_sql_keywords(tmp_path):
+    store = FileStore(str(tmp_path / 'dir.sqlite'), metadata_fields={'group': str})
+    store.create_tables()
+    store.upsert_files([('/data', 'a.txt', 1, 3, '2024-01-01 00:00:00', {'group': 'text'}, 1, 1)])
+    store.upsert_files([('/data', 'a.txt', 1, 3, '2024-01-01 00:00:00', {'group': 'code'}, 2, 1)])
+    assert store.get_file_snapshots('/data', 'group') == {'/data/a.txt': (2, 3, 1)}
+    assert store.conn.execute('SELECT "group" FROM file_fields').fetchall() == [('code', )]
+    store.close()
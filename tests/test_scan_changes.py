@@ -0,0 +1,21 @@
+import os
+from localitylens.dir_walker.index import scan_changes, iter_files_and_dirs
+
+
+def test_symlink_loops_are_recorded_not_raised(tmp_path):
+    root = tmp_path / 'root'
+    (root / 'sub').mkdir(parents=True)
+    (root / 'sub' / 'file.txt').write_text('hello')
+    os.symlink('b', root / 'a')
+    os.symlink('a', root / 'b')
+    os.symlink('self', root / 'sub' / 'self')
+
+    added, modified, deleted = scan_changes(str(root), [], {})
+    paths = sorted(record[0] for record in added)
+    expected = sorted(str(root / name) for name in ('a', 'b', 'sub', 'sub/file.txt', 'sub/self'))
+    assert paths == expected and modified == [] and deleted == []
+    assert sorted(record[0] for record in iter_files_and_dirs(str(root), [])) == expected
+
+    # the links' own stat is stable, a second scan finds nothing changed
+    snapshot = {record[0]: (record[6], record[5], record[7]) for record in added}
+    assert scan_changes(str(root), [], snapshot) == ([], [], [])
@@ -0,0 +1,60 @@
+import os
+import pytest
+from localitylens.dir_walker import detection
+from localitylens.dir_walker.index import update_index
+from localitylens.dir_walker.storage import FileStore
+
+
+@pytest.fixture
+def detected(monkeypatch):
+    # stands in for Magika, detects by the first bytes and records the paths
+    paths = []
+
+    def detect_content_types(batch, num_workers=None):
+        for path in batch:
+            paths.append(path)
+            with open(path, 'rb') as f:
+                pdf = f.read(5) == b'%PDF-'
+            yield path, {'group': 'document' if pdf else 'text', 'mime_type': 'application/pdf' if pdf else 'text/plain'}
+    monkeypatch.setattr(detection, 'detect_content_types', detect_content_types)
+    return paths
+
+
+def mime_type(store, path):
+    row = store.conn.execute('''
+    SELECT meta_value FROM file_metadata JOIN files USING (file_id)
+     WHERE files.filename = ? AND meta_key = 'mime_type' ''', (os.path.basename(path), )).fetchone()
+    if row is None and 'mime_type' in store.fields:
+        row = store.conn.execute('''
+        SELECT file_fields.mime_type FROM file_fields JOIN files USING (file_id) WHERE files.filename = ?''',
+                                 (os.path.basename(path), )).fetchone()
+    return row[0] if row else None
+
+
+@pytest.mark.parametrize('metadata_fields', [None, {'group': str, 'mime_type': str}])
+def test_change_written_without_detection_is_detected_later(tmp_path, detected, metadata_fields):
+    root = tmp_path / 'root'
+    root.mkdir()
+    path = str(root / 'doc')
+    with open(path, 'w') as f:
+        f.write('hello')
+    store = FileStore(str(tmp_path / 'dir.sqlite'), metadata_fields=metadata_fields)
+    store.create_tables()
+
+    update_index(str(root), [], detect_content=True, store=store)
+    assert detected == [path] and mime_type(store, path) == 'text/plain'
+
+    with open(path, 'w') as f:
+        f.write('%PDF-1.7 and more')
+    update_index(str(root), [], store=store)
+    assert mime_type(store, path) is None
+
+    del detected[:]
+    update_index(str(root), [], detect_content=True, store=store)
+    assert detected == [path] and mime_type(store, path) == 'application/pdf'
+
+    # unchanged files are not looked at again
+    del detected[:]
+    update_index(str(root), [], detect_content=True, store=store)
+    assert detected == []
+    store.close()
@@ -0,0 +1,71 @@
+import os
+import sys
+import pytest
+from localitylens.dir_walker.storage import FileStore
+from localitylens.dir_walker.watcher import DirectoryWatcher
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify is Linux only')
+
+
+def drain(watcher, timeout=0.2):
+    # handle events until none arrive for timeout seconds, then flush
+    while True:
+        events = watcher.inotify.read_events(timeout=timeout)
+        if not events:
+            break
+        for path, mask, wd in events:
+            watcher.handle(path, mask, wd)
+    watcher.flush()
+
+
+@pytest.fixture
+def watcher(tmp_path):
+    root = tmp_path / 'root'
+    (root / 'a').mkdir(parents=True)
+    store = FileStore(str(tmp_path / 'dir.sqlite'))
+    store.create_tables()
+    watcher = DirectoryWatcher([], roots=[str(root)], store=store)
+    watcher.start()
+    yield watcher
+    watcher.inotify.close()
+    store.close()
+
+
+def test_renamed_directory_keeps_its_watch(watcher):
+    root = watcher.roots[0]
+    os.rename(os.path.join(root, 'a'), os.path.join(root, 'b'))
+    drain(watcher)
+    assert os.path.join(root, 'a') not in watcher.inotify.paths
+
+    with open(os.path.join(root, 'b', 'new.txt'), 'w') as f:
+        f.write('hello')
+    drain(watcher)
+    snapshot = watcher.store.get_file_snapshots(root)
+    assert os.path.join(root, 'b', 'new.txt') in snapshot
+    assert os.path.join(root, 'a') not in snapshot
+
+
+def test_recreated_directory_is_watched_again(watcher):
+    root = watcher.roots[0]
+    os.rename(os.path.join(root, 'a'), os.path.join(root, 'b'))
+    drain(watcher)
+    os.mkdir(os.path.join(root, 'a'))
+    drain(watcher)
+
+    with open(os.path.join(root, 'a', 'new.txt'), 'w') as f:
+        f.write('hello')
+    drain(watcher)
+    assert os.path.join(root, 'a', 'new.txt') in watcher.store.get_file_snapshots(root)
+
+
+def test_symlink_loop_does_not_stop_flush(watcher):
+    root = watcher.roots[0]
+    loop = os.path.join(root, 'a', 'loop')
+    os.symlink(loop, loop)
+    with open(os.path.join(root, 'a', 'new.txt'), 'w') as f:
+        f.write('hello')
+    drain(watcher)
+    assert watcher.pending == {}
+    snapshot = watcher.store.get_file_snapshots(root)
+    assert loop in snapshot
+    assert os.path.join(root, 'a', 'new.txt') in snapshot